@@ -4,118 +4,407 @@ Position Calculations Module
 Contains all mathematical calculations for rigid body position tracking
 """
 
+import importlib.util
+import threading
 import numpy as np
 
+# Numba is optional; the NumPy code path is used without it. Importing Numba costs more
+# than the rest of the tracker's startup, so only look it up here and compile the
+# kernels the first time they are needed (see _jit_kernels)
+try:
+    _HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+except (ImportError, ValueError):
+    _HAVE_NUMBA = False
+_jitted = False
+_jit_lock = threading.Lock()
 
-class PositionCalculator:
-    """Handles all position and rotation calculations for rigid body tracking"""
-    
-    def __init__(self):
-        pass
+# Reference CSV columns holding the femur quaternion, listed in the [x, y, z, w] order
+# used by every function in this module. The CSV stores the tracker quaternion exactly
+# as NatNet streams it, (x, y, z, w), under the Femur_Rot_W/X/Y/Z headers, so the
+# columns must be read in header order rather than reordered by name.
+REFERENCE_ROTATION_COLUMNS = ('Femur_Rot_W', 'Femur_Rot_X', 'Femur_Rot_Y', 'Femur_Rot_Z')
+
+# Coefficients of Eberly's polynomial slerp (n = 8): u_i = 1/(i(2i+1)), v_i = i/(2i+1),
+# with the last pair scaled by mu to minimize the maximum approximation error
+_SLERP_MU = 1.85298109240830
+_SLERP_U = 1.0 / (np.arange(1, 9) * (2.0 * np.arange(1, 9) + 1.0))
+_SLERP_V = np.arange(1, 9) / (2.0 * np.arange(1, 9) + 1.0)
+_SLERP_U[-1] *= _SLERP_MU
+_SLERP_V[-1] *= _SLERP_MU
+
+
+def _rotate_offset(qx, qy, qz, qw, vx, vy, vz, px, py, pz, out, i):
+    """
+    Rotate the offset (vx, vy, vz) by quaternion (qx, qy, qz, qw), add the position
+    (px, py, pz) and write the result into row i of out. This is the one row kernel
+    the batch kernels below share; written with scalar math so Numba can compile it.
+    A zero quaternion is treated as the identity.
+    """
+    # t = 2 * (q_xyz x v) / |q|^2, or 0 for a zero quaternion so v is left unrotated
+    n = qx*qx + qy*qy + qz*qz + qw*qw
+    s = 2.0 / n if n != 0.0 else 0.0
+    tx = s * (qy*vz - qz*vy)
+    ty = s * (qz*vx - qx*vz)
+    tz = s * (qx*vy - qy*vx)
     
-    def quaternion_to_rotation_matrix(self, q):
-        """Convert quaternion [x, y, z, w] to rotation matrix"""
-        x, y, z, w = q
-        
-        # Normalize quaternion
-        norm = np.sqrt(x*x + y*y + z*z + w*w)
-        if norm == 0:
-            return np.eye(3)
-        x, y, z, w = x/norm, y/norm, z/norm, w/norm
-        
-        # Convert to rotation matrix
-        R = np.array([
-            [1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)],
-            [2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)],
-            [2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)]
-        ])
-        return R
-    
-    def calculate_updated_stylus_position(self, reference_position, reference_rotation, reference_stylus_pos, 
-                                         new_position, new_rotation):
-        """
-        Calculate the updated stylus position based on tracker movement.
-        Uses Y-up coordinate system: X-right, Y-up, Z-forward.
-        
-        Args:
-            reference_position: List [x, y, z] in mm - reference tracker position
-            reference_rotation: List [x, y, z, w] - reference tracker quaternion
-            reference_stylus_pos: List [x, y, z] in mm - stylus position at reference
-            new_position: List [x, y, z] in mm - new tracker position
-            new_rotation: List [x, y, z, w] - new tracker quaternion
-        
-        Returns:
-            List [x, y, z] in mm - updated stylus position
-        """
-        # Convert inputs to numpy arrays
-        ref_pos = np.array(reference_position)
-        ref_rot = np.array(reference_rotation)
-        ref_stylus = np.array(reference_stylus_pos)
-        new_pos = np.array(new_position)
-        new_rot = np.array(new_rotation)
-        
-        # Get rotation matrices
-        R_ref = self.quaternion_to_rotation_matrix(ref_rot)
-        R_new = self.quaternion_to_rotation_matrix(new_rot)
-        
-        # Calculate the offset vector from tracker to stylus in reference frame
-        offset_in_ref_frame = ref_stylus - ref_pos
-        
-        # Transform the offset to the tracker's local coordinate system at reference
-        offset_local = R_ref.T @ offset_in_ref_frame
-        
-        # Transform the offset to the new tracker orientation
-        offset_in_new_frame = R_new @ offset_local
-        
-        # Calculate the new stylus position
-        new_stylus_pos = new_pos + offset_in_new_frame
+    # p + v + w*t + q_xyz x t
+    out[i, 0] = px + vx + qw*tx + (qy*tz - qz*ty)
+    out[i, 1] = py + vy + qw*ty + (qz*tx - qx*tz)
+    out[i, 2] = pz + vz + qw*tz + (qx*ty - qy*tx)
+
+
+def _apply_delta(new_pos, qx, qy, qz, qw, offsets, out):
+    """
+    Rotate every row of offsets by quaternion (qx, qy, qz, qw), add new_pos and
+    write the results into out.
+    """
+    for i in range(offsets.shape[0]):
+        _rotate_offset(qx, qy, qz, qw, offsets[i, 0], offsets[i, 1], offsets[i, 2],
+                       new_pos[0], new_pos[1], new_pos[2], out, i)
+    return out
+
+
+def _xform_batch(ref_p, ref_q, ref_s, new_p, new_q, out):
+    """
+    Move each reference stylus with the tracker: rotate the offset ref_s - ref_p by the
+    delta rotation new_q * conj(ref_q) and add new_p, row by row over (N, 3)/(N, 4)
+    reference tables, written into out. Quaternions are [x, y, z, w]; zero quaternions
+    are treated as the identity.
+    """
+    ax, ay, az, aw = new_q[0], new_q[1], new_q[2], new_q[3]
+    if ax*ax + ay*ay + az*az + aw*aw == 0.0:
+        aw = 1.0
+    for i in range(ref_p.shape[0]):
+        # delta = new_q * conj(ref_q[i])
+        bx, by, bz, bw = -ref_q[i, 0], -ref_q[i, 1], -ref_q[i, 2], ref_q[i, 3]
+        if bx*bx + by*by + bz*bz + bw*bw == 0.0:
+            bw = 1.0
+        qx = aw*bx + ax*bw + ay*bz - az*by
+        qy = aw*by - ax*bz + ay*bw + az*bx
+        qz = aw*bz + ax*by - ay*bx + az*bw
+        qw = aw*bw - ax*bx - ay*by - az*bz
         
-        return new_stylus_pos.tolist()
+        _rotate_offset(qx, qy, qz, qw,
+                       ref_s[i, 0] - ref_p[i, 0], ref_s[i, 1] - ref_p[i, 1], ref_s[i, 2] - ref_p[i, 2],
+                       new_p[0], new_p[1], new_p[2], out, i)
+    return out
+
+
+def _jit_kernels():
+    """
+    Replace the kernels above with their Numba-compiled versions on first use
     
-    def calculate_position_error(self, calculated_position, actual_position):
-        """
-        Calculate the error between calculated and actual positions
-        
-        Args:
-            calculated_position: List [x, y, z] in mm - calculated position
-            actual_position: List [x, y, z] in mm - actual position
-        
-        Returns:
-            dict with error components and magnitude
-        """
-        calc_pos = np.array(calculated_position)
-        actual_pos = np.array(actual_position)
-        
-        error = actual_pos - calc_pos
-        error_magnitude = np.sqrt(np.sum(error**2))
-        
-        return {
-            'x_error': error[0],
-            'y_error': error[1], 
-            'z_error': error[2],
-            'magnitude': error_magnitude
-        }
-    
-    def convert_to_millimeters(self, position_meters):
-        """
-        Convert position from meters to millimeters
-        
-        Args:
-            position_meters: List [x, y, z] in meters
-        
-        Returns:
-            List [x, y, z] in millimeters
-        """
-        return [pos * 1000 for pos in position_meters]
-    
-    def convert_to_meters(self, position_millimeters):
-        """
-        Convert position from millimeters to meters
-        
-        Args:
-            position_millimeters: List [x, y, z] in millimeters
-        
-        Returns:
-            List [x, y, z] in meters
-        """
-        return [pos / 1000 for pos in position_millimeters]
+    Returns:
+        bool: True if the compiled kernels are in place, False to use the NumPy path
+    """
+    global _HAVE_NUMBA, _jitted, _rotate_offset, _apply_delta, _xform_batch
+    if _jitted or not _HAVE_NUMBA:
+        return _jitted
+    
+    with _jit_lock:
+        if not _jitted:
+            try:
+                from numba import njit
+            except ImportError:
+                _HAVE_NUMBA = False
+                return False
+            
+            # With at most 20 points per frame, parallel overhead would exceed the benefit
+            _rotate_offset = njit(fastmath=True, cache=True)(_rotate_offset)
+            _apply_delta = njit(parallel=False, fastmath=True, cache=True)(_apply_delta)
+            _xform_batch = njit(parallel=False, fastmath=True, cache=True)(_xform_batch)
+            _jitted = True
+    return True
+
+
+def quaternion_to_rotation_matrix(q):
+    """
+    Convert quaternion(s) [x, y, z, w] to rotation matrices
+    
+    Args:
+        q: Array-like of shape (..., 4) - one or more [x, y, z, w] quaternions
+    
+    Returns:
+        ndarray of shape (..., 3, 3) - rotation matrices
+    
+    A zero quaternion gives the identity matrix.
+    """
+    q = np.asarray(q, dtype=float)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    
+    # Fold normalization into the 2/n scale factor (Shoemake form) so non-unit
+    # quaternions still produce a proper rotation without a sqrt; zero quaternions get
+    # s = 0, which leaves the identity
+    n = (q * q).sum(-1)
+    s = np.divide(2.0, n, out=np.zeros_like(n), where=n != 0)
+    
+    xx, yy, zz = s*x*x, s*y*y, s*z*z
+    xy, xz, yz = s*x*y, s*x*z, s*y*z
+    wx, wy, wz = s*w*x, s*w*y, s*w*z
+    
+    # Write each term straight into the output instead of stacking temporaries
+    R = np.empty(q.shape[:-1] + (3, 3))
+    np.add(yy, zz, out=R[..., 0, 0])
+    np.add(xx, zz, out=R[..., 1, 1])
+    np.add(xx, yy, out=R[..., 2, 2])
+    for i in range(3):
+        np.subtract(1.0, R[..., i, i], out=R[..., i, i])
+    np.subtract(xy, wz, out=R[..., 0, 1])
+    np.add(xz, wy, out=R[..., 0, 2])
+    np.add(xy, wz, out=R[..., 1, 0])
+    np.subtract(yz, wx, out=R[..., 1, 2])
+    np.subtract(xz, wy, out=R[..., 2, 0])
+    np.add(yz, wx, out=R[..., 2, 1])
+    return R
+
+
+def quat_conj(q):
+    """Return the conjugate of quaternion(s) [x, y, z, w], i.e. the inverse rotation"""
+    q = np.asarray(q, dtype=float)
+    return np.concatenate((-q[..., :3], q[..., 3:]), axis=-1)
+
+
+def quat_mul(a, b):
+    """
+    Multiply quaternion(s) a * b, both [x, y, z, w]. The product applies b first, then a.
+    
+    Args:
+        a: Array-like of shape (..., 4)
+        b: Array-like of shape (..., 4)
+    
+    Returns:
+        ndarray of shape (..., 4) - product quaternion(s) [x, y, z, w]
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    return np.stack([
+        aw*bx + ax*bw + ay*bz - az*by,
+        aw*by - ax*bz + ay*bw + az*bx,
+        aw*bz + ax*by - ay*bx + az*bw,
+        aw*bw - ax*bx - ay*by - az*bz
+    ], axis=-1)
+
+
+def rotate_by_quat(q, v):
+    """
+    Rotate vector(s) by quaternion(s) without building a rotation matrix.
+    Uses v' = v + w*t + q_xyz x t with t = 2*(q_xyz x v), scaled by 1/|q|^2
+    so non-unit quaternions still rotate correctly; a zero quaternion leaves v unchanged.
+    
+    Args:
+        q: Array-like of shape (..., 4) - [x, y, z, w] quaternion(s)
+        v: Array-like of shape (..., 3) - vector(s) to rotate
+    
+    Returns:
+        ndarray of shape (..., 3) - rotated vector(s)
+    """
+    q = np.asarray(q, dtype=float)
+    v = np.asarray(v, dtype=float)
+    q_xyz, w = q[..., :3], q[..., 3:]
+    
+    n = (q * q).sum(-1, keepdims=True)
+    s = np.divide(2.0, n, out=np.zeros_like(n), where=n != 0)
+    
+    t = s * np.cross(q_xyz, v)
+    return v + w * t + np.cross(q_xyz, t)
+
+
+def fast_slerp(q0, q1, t):
+    """
+    Interpolate between unit quaternions [x, y, z, w] along the shorter arc.
+    Evaluates Eberly's polynomial approximation of the slerp weights
+    sin((1-t)*theta)/sin(theta) and sin(t*theta)/sin(theta), so no acos or sin
+    is needed; components are within about 3e-5 of exact slerp.
+    
+    Args:
+        q0: Array-like of shape (..., 4) - start quaternion(s), unit length
+        q1: Array-like of shape (..., 4) - end quaternion(s), unit length
+        t: Float or array broadcastable to q0.shape[:-1] - interpolation parameter in [0, 1]
+    
+    Returns:
+        ndarray of shape (..., 4) - interpolated quaternion(s)
+    """
+    q0 = np.asarray(q0, dtype=float)
+    q1 = np.asarray(q1, dtype=float)
+    t = np.asarray(t, dtype=float)
+    
+    # q and -q are the same rotation, so flip q1 onto q0's side to take the shorter arc
+    x = (q0 * q1).sum(-1)
+    sign = np.where(x < 0, -1.0, 1.0)
+    xm1 = sign * x - 1.0
+    
+    # Horner evaluation of both weights, innermost term first
+    d = 1.0 - t
+    t2, d2 = t * t, d * d
+    c_t = c_d = 1.0
+    for u, v in zip(_SLERP_U[::-1], _SLERP_V[::-1]):
+        c_t = 1.0 + (u * t2 - v) * xm1 * c_t
+        c_d = 1.0 + (u * d2 - v) * xm1 * c_d
+    
+    return (d * c_d)[..., None] * q0 + (sign * t * c_t)[..., None] * q1
+
+
+def calculate_updated_stylus_position(reference_position, reference_rotation, reference_stylus_pos,
+                                      new_position, new_rotation):
+    """
+    Calculate the updated stylus position based on tracker movement.
+    Uses Y-up coordinate system: X-right, Y-up, Z-forward.
+    
+    Args:
+        reference_position: List [x, y, z] in mm - reference tracker position
+        reference_rotation: List [x, y, z, w] - reference tracker quaternion
+        reference_stylus_pos: List [x, y, z] in mm - stylus position at reference
+        new_position: List [x, y, z] in mm - new tracker position
+        new_rotation: List [x, y, z, w] - new tracker quaternion
+    
+    Returns:
+        List [x, y, z] in mm - updated stylus position
+    """
+    # Rotate the tracker-to-stylus offset by the delta rotation (R_new @ R_ref.T) and
+    # add the new tracker position, as a one-row batch. asarray doesn't copy float arrays
+    _jit_kernels()
+    new_stylus_pos = _xform_batch(np.asarray(reference_position, dtype=float).reshape(1, 3),
+                                  np.asarray(reference_rotation, dtype=float).reshape(1, 4),
+                                  np.asarray(reference_stylus_pos, dtype=float).reshape(1, 3),
+                                  np.asarray(new_position, dtype=float),
+                                  np.asarray(new_rotation, dtype=float), np.empty((1, 3)))[0]
+    
+    return new_stylus_pos.tolist()
+
+
+def calculate_updated_stylus_positions(reference_positions, reference_rotations, reference_stylus_positions,
+                                       new_position, new_rotation, out=None):
+    """
+    Calculate updated stylus positions for a whole table of reference poses at once.
+    
+    Args:
+        reference_positions: (N, 3) array in mm - reference tracker positions
+        reference_rotations: (N, 4) array [x, y, z, w] - reference tracker quaternions
+        reference_stylus_positions: (N, 3) array in mm - stylus positions at reference
+        new_position: Array [x, y, z] in mm - new tracker position
+        new_rotation: Array [x, y, z, w] - new tracker quaternion
+        out: Optional (N, 3) float array to write the results into
+    
+    Returns:
+        (N, 3) ndarray in mm - updated stylus positions
+    """
+    if out is None:
+        out = np.empty(np.shape(reference_positions))
+    
+    if _jit_kernels():
+        return _xform_batch(np.asarray(reference_positions, dtype=float),
+                            np.asarray(reference_rotations, dtype=float),
+                            np.asarray(reference_stylus_positions, dtype=float),
+                            np.asarray(new_position, dtype=float),
+                            np.asarray(new_rotation, dtype=float), out)
+    
+    # The new pose broadcasts against every reference row; zero quaternions stand for
+    # no rotation, so swap them for the identity before combining them
+    identity = (0.0, 0.0, 0.0, 1.0)
+    new_rotation = np.where(np.any(new_rotation, axis=-1, keepdims=True), new_rotation, identity)
+    reference_rotations = np.where(np.any(reference_rotations, axis=-1, keepdims=True),
+                                   reference_rotations, identity)
+    delta = quat_mul(new_rotation, quat_conj(reference_rotations))
+    offsets = np.subtract(reference_stylus_positions, reference_positions)
+    return np.add(new_position, rotate_by_quat(delta, offsets), out=out)
+
+
+def update_all_styluses(new_position, new_rotation, offsets_local, out=None):
+    """
+    Calculate updated stylus positions for a whole block of local offsets.
+    
+    Args:
+        new_position: Array [x, y, z] in mm - new tracker position
+        new_rotation: Array [x, y, z, w] - new tracker quaternion
+        offsets_local: (N, 3) array in mm - tracker-to-stylus offsets in the tracker's local frame
+        out: Optional (N, 3) float array to write the results into
+    
+    Returns:
+        (N, 3) ndarray in mm - updated stylus positions
+    """
+    if out is None:
+        out = np.empty(np.shape(offsets_local))
+    
+    if _jit_kernels():
+        qx, qy, qz, qw = (float(c) for c in new_rotation)
+        return _apply_delta(np.asarray(new_position, dtype=float), qx, qy, qz, qw,
+                            np.asarray(offsets_local, dtype=float), out)
+    
+    # One rotation for every offset, so build R once and rotate the whole block with a
+    # single matmul (offsets are rows, hence R.T) instead of two batched cross products
+    rotation_matrix = quaternion_to_rotation_matrix(new_rotation)
+    return np.add(new_position, np.matmul(offsets_local, rotation_matrix.T), out=out)
+
+
+def calculate_position_error(calculated_position, actual_position):
+    """
+    Calculate the error between calculated and actual positions
+    
+    Args:
+        calculated_position: List [x, y, z] in mm - calculated position
+        actual_position: List [x, y, z] in mm - actual position
+    
+    Returns:
+        dict with error components and magnitude
+    """
+    calc_pos = np.array(calculated_position)
+    actual_pos = np.array(actual_position)
+    
+    error = actual_pos - calc_pos
+    error_magnitude = np.sqrt(np.sum(error**2))
+    
+    return {
+        'x_error': error[0],
+        'y_error': error[1], 
+        'z_error': error[2],
+        'magnitude': error_magnitude
+    }
+
+
+def convert_to_millimeters(position_meters, out=None):
+    """
+    Convert position from meters to millimeters
+    
+    Args:
+        position_meters: Array-like [x, y, z] in meters
+        out: Optional float array of shape (3,) to write the result into
+    
+    Returns:
+        ndarray [x, y, z] in millimeters
+    """
+    return np.multiply(position_meters, 1000.0, out=out, dtype=float)
+
+
+def convert_to_meters(position_millimeters, out=None):
+    """
+    Convert position from millimeters to meters
+    
+    Args:
+        position_millimeters: Array-like [x, y, z] in millimeters
+        out: Optional float array of shape (3,) to write the result into
+    
+    Returns:
+        ndarray [x, y, z] in meters
+    """
+    return np.divide(position_millimeters, 1000.0, out=out, dtype=float)
+
+
+class PositionCalculator:
+    """
+    Handles all position and rotation calculations for rigid body tracking.
+    Thin wrapper around the module-level functions, kept for backward compatibility.
+    """
+    
+    quaternion_to_rotation_matrix = staticmethod(quaternion_to_rotation_matrix)
+    quat_conj = staticmethod(quat_conj)
+    quat_mul = staticmethod(quat_mul)
+    rotate_by_quat = staticmethod(rotate_by_quat)
+    fast_slerp = staticmethod(fast_slerp)
+    calculate_updated_stylus_position = staticmethod(calculate_updated_stylus_position)
+    calculate_updated_stylus_positions = staticmethod(calculate_updated_stylus_positions)
+    update_all_styluses = staticmethod(update_all_styluses)
+    calculate_position_error = staticmethod(calculate_position_error)
+    convert_to_millimeters = staticmethod(convert_to_millimeters)
+    convert_to_meters = staticmethod(convert_to_meters)
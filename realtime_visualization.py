@@ -7,23 +7,37 @@ Displays tracker center as sphere and L-M planes in real-time
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Line3DCollection, Poly3DCollection
 import threading
-import time
-import csv
 from position_calculations import PositionCalculator
+from visualize_points import load_reference_points
 
 class RealtimeVisualizer:
     def __init__(self, csv_filename='Attune_5_Left_Points.csv'):
         self.csv_filename = csv_filename
         self.calculator = PositionCalculator()
         self.running = False
-        self.thread = None
+        
+        # Guards the tracker state shared between the receive thread and the animation
+        # on the main thread; _dirty marks that new data arrived since the last redraw
+        self._lock = threading.Lock()
+        self._dirty = False
         
         # Data storage
         self.current_femur_pos = None
         self.current_femur_rot = None
-        self.calculated_planes = None
-        self.reference_data = None
+        self._current_femur_mm = None
+        self._ref_index = {}
+        self._ref_pos = np.empty((0, 3))
+        self._ref_quat = np.empty((0, 4))
+        self._ref_stylus = np.empty((0, 3))
+        self._ref_rot = np.empty((0, 4))
+        self._labels = []
+        self._pair_labels = []
+        self._offsets_local = np.empty((0, 3))
+        self._stylus_out = np.empty((0, 3))
+        self._l_pts = self._stylus_out
+        self._m_pts = self._stylus_out
         
         # Load reference data
         self.load_reference_data()
@@ -31,138 +45,126 @@ class RealtimeVisualizer:
         # Matplotlib setup
         self.fig = None
         self.ax = None
+        self._anim = None
         self.sphere = None
-        self.planes = []
+        self._view_center = None
         
     def load_reference_data(self):
         """Load reference data from CSV file"""
-        self.reference_data = {}
-        
         try:
-            with open(self.csv_filename, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    point_number = row['Point_Number']
-                    
-                    # Extract femur position and rotation
-                    femur_pos = [
-                        float(row['Femur_Pos_X_mm']),
-                        float(row['Femur_Pos_Y_mm']),
-                        float(row['Femur_Pos_Z_mm'])
-                    ]
-                    femur_rot = [
-                        float(row['Femur_Rot_W']),
-                        float(row['Femur_Rot_X']),
-                        float(row['Femur_Rot_Y']),
-                        float(row['Femur_Rot_Z'])
-                    ]
-                    
-                    # Extract stylus position
-                    stylus_pos = [
-                        float(row['Stylus_Pos_X_mm']),
-                        float(row['Stylus_Pos_Y_mm']),
-                        float(row['Stylus_Pos_Z_mm'])
-                    ]
-                    
-                    self.reference_data[point_number] = {
-                        'femur_pos': femur_pos,
-                        'femur_rot': femur_rot,
-                        'stylus_pos': stylus_pos
-                    }
-                    
+            # Parsed once per file version and shared with the tracker; zero rotations
+            # already come back as the identity
+            reference = load_reference_points(self.csv_filename)
+            self._ref_pos = reference['femur']
+            self._ref_stylus = reference['stylus']
+            self._ref_index = reference['index']
+            
+            # Invariant: reference quaternions are stored unit-norm
+            self._ref_quat = reference['rotation'] / np.linalg.norm(reference['rotation'], axis=1, keepdims=True)
+            
         except FileNotFoundError:
             print(f"Error: CSV file {self.csv_filename} not found")
-            self.reference_data = {}
+            self._ref_index = {}
         except Exception as e:
             print(f"Error loading reference data: {e}")
-            self.reference_data = {}
+            self._ref_index = {}
+        
+        # Gather every complete L-M pair into (2*N, ...) blocks:
+        # rows [0, N) hold the L points and rows [N, 2*N) the matching M points
+        pairs = [(f'L{i}', f'M{i}') for i in range(1, 11)
+                 if f'L{i}' in self._ref_index and f'M{i}' in self._ref_index]
+        self._labels = [l_label for l_label, _ in pairs] + [m_label for _, m_label in pairs]
+        rows = [self._ref_index[label] for label in self._labels]
+        self._ref_rot = self._ref_quat[rows].reshape(-1, 4)
+        offsets_world = (self._ref_stylus[rows] - self._ref_pos[rows]).reshape(-1, 3)
+        
+        # The stylus offset in the tracker's local frame only depends on the static
+        # reference data, so rotate all offsets back by their inverse (conjugate)
+        # reference quaternions in one batched call here instead of every frame
+        self._offsets_local = self.calculator.rotate_by_quat(
+            self.calculator.quat_conj(self._ref_rot), offsets_world
+        )
+        
+        # Preallocated output block so the per-frame update doesn't allocate.
+        # _l_pts and _m_pts are (N, 3) views of its L and M halves, updated in place;
+        # the _draw copies are the snapshot update_plot takes under the lock
+        n_pairs = len(pairs)
+        self._pair_labels = [f'{l_label}-{m_label}' for l_label, m_label in pairs]
+        self._stylus_out = np.empty_like(self._offsets_local)
+        self._l_pts = self._stylus_out[:n_pairs]
+        self._m_pts = self._stylus_out[n_pairs:]
+        self._l_draw = np.empty_like(self._l_pts)
+        self._m_draw = np.empty_like(self._m_pts)
     
     def update_tracker_data(self, femur_pos_meters, femur_rot_quat):
-        """Update current tracker position and rotation"""
-        self.current_femur_pos = femur_pos_meters
-        self.current_femur_rot = femur_rot_quat
+        """
+        Update current tracker position and rotation
         
-        # Calculate updated positions for all L-M pairs
-        self.calculate_planes()
+        Args:
+            femur_pos_meters: List [x, y, z] in meters - current tracker position
+            femur_rot_quat: List [x, y, z, w] - current tracker quaternion as streamed by NatNet;
+                a zero quaternion is drawn as the identity, like every other calculation does
+        """
+        with self._lock:
+            # Convert once here so the per-frame math works on ndarrays directly
+            self.current_femur_pos = np.asarray(femur_pos_meters, dtype=float)
+            self.current_femur_rot = np.asarray(femur_rot_quat, dtype=float)
+            
+            # Shared by calculate_planes and update_plot so the conversion happens once per update
+            self._current_femur_mm = self.calculator.convert_to_millimeters(self.current_femur_pos)
+            
+            # Calculate updated positions for all L-M pairs
+            self.calculate_planes()
+            self._dirty = True
     
     def calculate_planes(self):
         """Calculate the L-M plane positions based on current tracker data"""
-        if not self.current_femur_pos or not self.current_femur_rot:
+        if self.current_femur_pos is None or self.current_femur_rot is None:
             return
-            
-        self.calculated_planes = []
-        
-        # Convert current position to mm
-        current_femur_pos_mm = self.calculator.convert_to_millimeters(self.current_femur_pos)
         
-        # Calculate L-M pairs (L1-M1, L2-M2, etc.)
-        for i in range(1, 11):
-            l_label = f'L{i}'
-            m_label = f'M{i}'
-            
-            if l_label in self.reference_data and m_label in self.reference_data:
-                # Get reference data
-                l_ref = self.reference_data[l_label]
-                m_ref = self.reference_data[m_label]
-                
-                # Calculate updated positions
-                l_pos = self.calculator.calculate_updated_stylus_position(
-                    l_ref['femur_pos'], l_ref['femur_rot'], l_ref['stylus_pos'],
-                    current_femur_pos_mm, self.current_femur_rot
-                )
-                
-                m_pos = self.calculator.calculate_updated_stylus_position(
-                    m_ref['femur_pos'], m_ref['femur_rot'], m_ref['stylus_pos'],
-                    current_femur_pos_mm, self.current_femur_rot
-                )
-                
-                self.calculated_planes.append({
-                    'l_pos': l_pos,
-                    'm_pos': m_pos,
-                    'label': f'L{i}-M{i}'
-                })
+        # Rotate all cached offsets in a single call, filling _l_pts and _m_pts in place
+        self.calculator.update_all_styluses(
+            self._current_femur_mm, self.current_femur_rot, self._offsets_local, out=self._stylus_out
+        )
     
-    def create_plane_polygon(self, l_pos, m_pos, center_pos, size=50):
-        """Create a plane polygon from L and M points"""
-        # Calculate the vector from L to M
-        lm_vector = np.array(m_pos) - np.array(l_pos)
-        lm_length = np.linalg.norm(lm_vector)
-        
-        if lm_length == 0:
-            return None
-            
-        # Normalize the vector
-        lm_unit = lm_vector / lm_length
-        
-        # Create perpendicular vector (cross with up vector)
-        up_vector = np.array([0, 1, 0])
-        if np.abs(np.dot(lm_unit, up_vector)) > 0.9:
-            up_vector = np.array([1, 0, 0])
+    def create_plane_polygons(self, l_pts, m_pts, size=50):
+        """
+        Create plane polygons for all L-M pairs at once
         
-        perp_vector = np.cross(lm_unit, up_vector)
-        perp_vector = perp_vector / np.linalg.norm(perp_vector)
+        Args:
+            l_pts: (N, 3) array in mm - L point positions
+            m_pts: (N, 3) array in mm - matching M point positions
+            size: Plane edge length in mm
         
-        # Create the third perpendicular vector
-        normal_vector = np.cross(lm_unit, perp_vector)
+        Returns:
+            (N, 4, 3) ndarray of plane corners; rows for pairs whose L and M coincide are NaN
+        """
+        l_pts = np.asarray(l_pts, dtype=float).reshape(-1, 3)
+        m_pts = np.asarray(m_pts, dtype=float).reshape(-1, 3)
         
-        # Create plane corners
-        half_size = size / 2
-        center = (np.array(l_pos) + np.array(m_pos)) / 2
+        # Normalized vectors from L to M
+        lm_vector = m_pts - l_pts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            lm_unit = lm_vector / np.linalg.norm(lm_vector, axis=1, keepdims=True)
         
-        corners = [
-            center + perp_vector * half_size + lm_unit * half_size,
-            center + perp_vector * half_size - lm_unit * half_size,
-            center - perp_vector * half_size - lm_unit * half_size,
-            center - perp_vector * half_size + lm_unit * half_size
-        ]
+        # Perpendicular vectors (cross with Y up, or X where L-M is nearly vertical)
+        up_vector = np.where(np.abs(lm_unit[:, 1:2]) > 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+        perp_vector = np.cross(lm_unit, up_vector)
+        perp_vector /= np.linalg.norm(perp_vector, axis=1, keepdims=True)
         
-        return np.array(corners)
+        # Corners at center +/- perp +/- lm, ordered around the edge of the quad
+        half_size = size / 2
+        center = (l_pts + m_pts) / 2
+        perp_signs = np.array([1, 1, -1, -1])[None, :, None]
+        lm_signs = np.array([1, -1, -1, 1])[None, :, None]
+        return (center[:, None, :]
+                + perp_signs * half_size * perp_vector[:, None, :]
+                + lm_signs * half_size * lm_unit[:, None, :])
     
     def setup_plot(self):
         """Setup the 3D plot"""
-        # Use a non-blocking backend
         import matplotlib
-        matplotlib.use('TkAgg')  # Use TkAgg backend for better threading support
+        matplotlib.use('TkAgg')
         
         self.fig = plt.figure(figsize=(12, 10))
         self.ax = self.fig.add_subplot(111, projection='3d')
@@ -178,113 +180,154 @@ class RealtimeVisualizer:
         
         # Initialize empty plots
         self.sphere = None
-        self.planes = []
+        self._view_center = None
+        self._create_artists()
         
-        plt.ion()  # Interactive mode
-        plt.show(block=False)  # Non-blocking show
+        # Closing the window ends the animation
+        self.fig.canvas.mpl_connect('close_event', lambda event: setattr(self, 'running', False))
+    
+    def _create_artists(self):
+        """Create the persistent plot artists that update_plot mutates every frame"""
+        # Sphere mesh for the tracker center, translated to the tracker position per frame
+        u = np.linspace(0, 2 * np.pi, 20)
+        v = np.linspace(0, np.pi, 20)
+        self._sphere_base_x = 10 * np.outer(np.cos(u), np.sin(v))
+        self._sphere_base_y = 10 * np.outer(np.sin(u), np.sin(v))
+        self._sphere_base_z = 10 * np.outer(np.ones(np.size(u)), np.cos(v))
+        
+        # One scatter for all L markers, one for all M markers and a single collection
+        # for the connecting lines. They are animated, i.e. left out of full redraws
+        # and blitted over the cached background instead
+        self._scatter_L = self.ax.scatter([], [], [], c='blue', marker='o', s=50, animated=True,
+                                          label='L points')
+        self._scatter_M = self.ax.scatter([], [], [], c='red', marker='^', s=50, animated=True,
+                                          label='M points')
+        self._lm_lines = Line3DCollection(np.empty((0, 2, 3)), colors='g', alpha=0.7, linewidths=2,
+                                          animated=True)
+        self.ax.add_collection(self._lm_lines, autolim=False)
+        
+        # All L-M planes as flat quads in one collection, one color per pair
+        self._plane_colors = plt.cm.tab10(np.linspace(0, 1, len(self._pair_labels)))
+        self._planes = Poly3DCollection(np.empty((0, 4, 3)), alpha=0.3, animated=True)
+        self.ax.add_collection(self._planes, autolim=False)
+        
+        # Add legend
+        if self._pair_labels:
+            self.ax.legend()
     
     def update_plot(self):
-        """Update the visualization"""
+        """
+        Update the plot artists from the latest tracker data
+        
+        Returns:
+            List of the artists that changed and need to be redrawn
+        """
         if not self.fig or not self.ax:
-            return
-            
-        # Clear previous plots
-        self.ax.clear()
+            return []
         
-        # Set labels
-        self.ax.set_xlabel('X (mm)')
-        self.ax.set_ylabel('Y (mm)')
-        self.ax.set_zlabel('Z (mm)')
-        self.ax.set_title('Real-time Tracker Visualization')
+        # Take a consistent snapshot of the data written by update_tracker_data
+        with self._lock:
+            femur_pos_mm = self._current_femur_mm
+            if femur_pos_mm is None:
+                return []
+            np.copyto(self._l_draw, self._l_pts)
+            np.copyto(self._m_draw, self._m_pts)
+        l_pts, m_pts = self._l_draw, self._m_draw
         
-        if self.current_femur_pos:
-            # Convert to mm for display
-            femur_pos_mm = self.calculator.convert_to_millimeters(self.current_femur_pos)
-            
-            # Draw tracker center as sphere
-            u = np.linspace(0, 2 * np.pi, 20)
-            v = np.linspace(0, np.pi, 20)
-            x_sphere = 10 * np.outer(np.cos(u), np.sin(v)) + femur_pos_mm[0]
-            y_sphere = 10 * np.outer(np.sin(u), np.sin(v)) + femur_pos_mm[1]
-            z_sphere = 10 * np.outer(np.ones(np.size(u)), np.cos(v)) + femur_pos_mm[2]
-            
-            self.ax.plot_surface(x_sphere, y_sphere, z_sphere, alpha=0.7, color='red')
+        # Surfaces can't be moved in place, so replace the tracker sphere
+        if self.sphere is not None:
+            self.sphere.remove()
+        
+        # Draw tracker center as sphere
+        self.sphere = self.ax.plot_surface(self._sphere_base_x + femur_pos_mm[0],
+                                           self._sphere_base_y + femur_pos_mm[1],
+                                           self._sphere_base_z + femur_pos_mm[2],
+                                           alpha=0.7, color='red', animated=True)
+        
+        # Draw L-M planes
+        if len(l_pts):
+            # Move all L and M points and the connecting lines in one update each
+            self._scatter_L.set_offsets(l_pts[:, :2])
+            self._scatter_L.set_3d_properties(l_pts[:, 2], 'z')
+            self._scatter_M.set_offsets(m_pts[:, :2])
+            self._scatter_M.set_3d_properties(m_pts[:, 2], 'z')
+            self._lm_lines.set_segments(np.stack([l_pts, m_pts], axis=1))
             
-            # Draw L-M planes
-            if self.calculated_planes:
-                colors = plt.cm.tab10(np.linspace(0, 1, len(self.calculated_planes)))
-                
-                for i, plane_data in enumerate(self.calculated_planes):
-                    l_pos = plane_data['l_pos']
-                    m_pos = plane_data['m_pos']
-                    label = plane_data['label']
-                    
-                    # Draw L and M points
-                    self.ax.scatter(l_pos[0], l_pos[1], l_pos[2], 
-                                  c='blue', marker='o', s=50, label=f'{label} L' if i == 0 else "")
-                    self.ax.scatter(m_pos[0], m_pos[1], m_pos[2], 
-                                  c='red', marker='^', s=50, label=f'{label} M' if i == 0 else "")
-                    
-                    # Draw connecting line
-                    self.ax.plot([l_pos[0], m_pos[0]], 
-                               [l_pos[1], m_pos[1]], 
-                               [l_pos[2], m_pos[2]], 
-                               'g-', alpha=0.7, linewidth=2)
-                    
-                    # Draw plane
-                    plane_poly = self.create_plane_polygon(l_pos, m_pos, femur_pos_mm)
-                    if plane_poly is not None:
-                        self.ax.plot_surface(
-                            plane_poly[:, 0].reshape(2, 2),
-                            plane_poly[:, 1].reshape(2, 2),
-                            plane_poly[:, 2].reshape(2, 2),
-                            alpha=0.3, color=colors[i]
-                        )
+            # Move the plane quads, leaving out pairs whose L and M coincide
+            plane_polys = self.create_plane_polygons(l_pts, m_pts)
+            valid = ~np.isnan(plane_polys).any(axis=(1, 2))
+            self._planes.set_verts(plane_polys[valid])
+            self._planes.set_facecolor(self._plane_colors[valid])
         
-        # Set equal aspect ratio
-        if self.current_femur_pos:
-            femur_pos_mm = self.calculator.convert_to_millimeters(self.current_femur_pos)
-            range_val = 100  # 100mm range around tracker
+        # Keep a 100mm range around the tracker. Blitting only redraws the animated
+        # artists, so when the view moves the static background (axes, ticks) is redrawn
+        # in full; the animation then re-caches it because the view changed
+        view_center = tuple(np.round(femur_pos_mm, 1))
+        if view_center != self._view_center:
+            self._view_center = view_center
+            range_val = 100
             self.ax.set_xlim(femur_pos_mm[0] - range_val, femur_pos_mm[0] + range_val)
             self.ax.set_ylim(femur_pos_mm[1] - range_val, femur_pos_mm[1] + range_val)
             self.ax.set_zlim(femur_pos_mm[2] - range_val, femur_pos_mm[2] + range_val)
+            self.fig.canvas.draw()
         
-        # Add legend
-        self.ax.legend()
+        return [self.sphere, self._planes, self._scatter_L, self._scatter_M, self._lm_lines]
+    
+    def _update_frame(self, frame):
+        """FuncAnimation callback: refresh the artists if new tracker data arrived"""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = False
+        if not dirty:
+            return []
         
-        # Refresh the plot
         try:
-            self.fig.canvas.draw()
-            self.fig.canvas.flush_events()
+            return self.update_plot()
         except Exception as e:
             print(f"Plot update error: {e}")
+            return []
     
-    def start_visualization(self):
-        """Start the real-time visualization"""
+    def start_visualization(self, block=False):
+        """
+        Start the real-time visualization on the calling (main) thread.
+        
+        The plot is redrawn by a matplotlib FuncAnimation timer; the tracker receive
+        thread only feeds update_tracker_data.
+        
+        Args:
+            block: If True, run the GUI event loop until the window is closed. If False
+                (the default, used by toggle_visualization), return right away; the caller
+                must keep the event loop running (e.g. with plt.pause)
+        """
         if self.running:
             return
             
         self.running = True
         
-        def visualization_loop():
-            try:
-                self.setup_plot()
-                while self.running:
-                    self.update_plot()
-                    time.sleep(0.1)  # Update at 10 FPS
-            except Exception as e:
-                print(f"Visualization error: {e}")
-                self.running = False
-        
-        self.thread = threading.Thread(target=visualization_loop, daemon=True)
-        self.thread.start()
-        print("Real-time visualization started. Press 'v' to toggle off.")
+        try:
+            from matplotlib.animation import FuncAnimation
+            
+            self.setup_plot()
+            self._anim = FuncAnimation(self.fig, self._update_frame, interval=100,
+                                       blit=True, cache_frame_data=False)
+            if block:
+                print("Real-time visualization started. Close the window to stop.")
+                plt.show(block=True)
+                # The window is closed once show returns
+                self.stop_visualization()
+            else:
+                print("Real-time visualization started. Press 'v' to toggle off.")
+                plt.show(block=False)
+        except Exception as e:
+            print(f"Visualization error: {e}")
+            self.running = False
     
     def stop_visualization(self):
         """Stop the real-time visualization"""
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=1.0)  # Wait max 1 second
+        if self._anim is not None:
+            self._anim.event_source.stop()
+            self._anim = None
         try:
             if self.fig:
                 plt.close(self.fig)
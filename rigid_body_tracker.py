@@ -4,18 +4,17 @@ Rigid Body Tracker
 Gets positional data from femur tracker (ID 1) and stylus (ID 2) and prints when 'c' is pressed
 """
 
-import mmap
-from re import M
+import os
+import queue
+import selectors
 import sys
 import time
 import threading
+from array import array
 import numpy as np
-import csv
 import socket
-from datetime import datetime
 from NatNetClient import NatNetClient
 from position_calculations import PositionCalculator
-from simple_realtime_viz import SimpleRealtimeViz
 
 # =============================================================================
 # CONFIGURATION - Modify these settings as needed
@@ -152,37 +151,44 @@ def get_local_ip_address(server_ip=None):
         return "0.0.0.0"
 
 class RigidBodyTracker:
+    # Body indices into the pose ring
+    _FEMUR = 0
+    _STYLUS = 1
+    
     def __init__(self, femur_id=DEFAULT_FEMUR_ID, stylus_id=DEFAULT_STYLUS_ID, 
-                 server_ip=DEFAULT_SERVER_IP, local_ip=DEFAULT_LOCAL_IP):
+                 server_ip=DEFAULT_SERVER_IP, local_ip=DEFAULT_LOCAL_IP, verbose=False):
         self.client = NatNetClient()
         self.femur_id = femur_id
         self.stylus_id = stylus_id
         self.server_ip = server_ip
         self.local_ip = local_ip
+        self.verbose = verbose  # Print the full report for mapped points, not just the matrix line
         
         # Initialize position calculator
         self.calculator = PositionCalculator()
         
-        # Initialize simple visualizer
-        self.visualizer = SimpleRealtimeViz()
+        # Simple visualizer, created on first use so matplotlib isn't imported at startup
+        self._visualizer = None
         
-        # Current position data
-        self.femur_position = None
-        self.femur_rotation = None
-        self.stylus_position = None
-        self.stylus_rotation = None
+        # Current pose data in a preallocated single-producer/single-consumer seqlock ring:
+        # per body (femur, stylus) two [x, y, z, qx, qy, qz, qw, t] slots, with the position
+        # already converted to millimeters, and a sequence
+        # number. The callback fills the slot readers aren't using and then publishes it by
+        # bumping the sequence number (a single 32-bit store); readers copy the published
+        # slot and retry if the sequence moved meanwhile, so no lock is needed
+        self._pose_ring = np.zeros((2, 2, 8))
+        self._seq = array('I', [0, 0])
         
         # Data reception flags
         self.femur_data_received = False
         self.stylus_data_received = False
         
-        # Timestamps for tracking data freshness
-        self.last_femur_data_time = 0
-        self.last_stylus_data_time = 0
+        # Data freshness (receive timestamps are kept in the pose ring)
         self.data_timeout = 0.2  # Consider data stale if not received within 0.2 seconds
         
         # Track previous position to detect if data is actually updating
         self.previous_femur_position = None
+        self._femur_position_diff = np.empty(3)
         self.last_femur_position_change_time = 0
         
         # Frame tracking
@@ -190,7 +196,12 @@ class RigidBodyTracker:
         self.frame_count = 0
         
         # Data storage
-        self.captured_points = []  # List to store captured data points
+        # Captured data points: one row per point in export column order, [femur x, y, z (mm),
+        # qx, qy, qz, qw, stylus x, y, z (mm), qx, qy, qz, qw], doubled in size when full
+        self._pts = np.empty((1024, 14))
+        self._pts_ts = []  # Capture timestamp of each stored row
+        self._n_pts = 0
+        self._ts_cache = (0, '')  # (second, formatted timestamp) for _now_str
         
         # Reference data for coordinate calculation
         self.reference_femur_position = None
@@ -202,6 +213,23 @@ class RigidBodyTracker:
         # Control flags
         self.running = True
         self.keyboard_thread = None
+        self._stdin_pending = ''  # Partial line read from a polled stdin
+        self._keyboard_lines = queue.Queue()  # Lines read by keyboard_thread, run by the main loop
+        self._awaiting_point_label = False  # Set by a bare 'p': the next line is the point label
+        
+        # Keyboard commands without arguments, looked up by key ('p' is handled separately)
+        self._keyboard_commands = {
+            'c': self.capture_positions,
+            's': self.store_positions,
+            'l': self.list_stored_points,
+            'e': self.export_data_points,
+            'r': self.capture_reference,
+            'u': self.calculate_updated_position,
+            't': self.test_connection,
+            'v': self._keyboard_visualize,
+            'q': self._keyboard_quit,
+            'h': self._keyboard_help,
+        }
         self.udp_thread = None
         
         # UDP server settings
@@ -211,13 +239,39 @@ class RigidBodyTracker:
         # Connection status
         self.connected = False
         self.connection_attempted = False
+        # The receive callback only counts packets; update_connection_status turns a
+        # moving count into the last_data_received timestamp (time.monotonic)
+        self._pkt_count = 0
+        self._pkt_count_at_last_check = 0
         self.last_data_received = 0
         self.connection_timeout = CONNECTION_TIMEOUT
         self.connection_check_interval = CONNECTION_CHECK_INTERVAL
         self.last_connection_check = 0
         self.connection_start_time = 0
         self.showing_connection_animation = False
-        
+        self._last_anim_frame = -1
+        self._connection_test_due = None  # time.monotonic() at which a running 't' test reports
+        
+    def _warm_up_calculations(self):
+        """Run the pose kernels once so Numba (if installed) compiles them now, not on the first query"""
+        # Reference tables come back read-only from the CSV loader, which Numba compiles separately
+        identity = np.array([[0.0, 0.0, 0.0, 1.0]])
+        zeros = np.zeros((1, 3))
+        for table in (identity, zeros):
+            table.setflags(write=False)
+        
+        new_rotation = np.array([0.0, 0.0, 0.0, 1.0])
+        self.calculator.calculate_updated_stylus_position(zeros[0], identity[0], zeros[0], np.zeros(3), new_rotation)
+        self.calculator.calculate_updated_stylus_positions(zeros, identity, zeros, np.zeros(3), new_rotation)
+    
+    @property
+    def visualizer(self):
+        """Simple visualizer, imported and created the first time it is needed"""
+        if self._visualizer is None:
+            from simple_realtime_viz import SimpleRealtimeViz
+            self._visualizer = SimpleRealtimeViz()
+        return self._visualizer
+    
     def setup_connection(self, server_ip=None, local_ip=None):
         """Configure the NatNet client for unicast connection"""
         # Use instance variables if not provided
@@ -287,42 +341,83 @@ class RigidBodyTracker:
         
     def on_rigid_body_received(self, rigid_body_id, position, rotation):
         """Callback function called when rigid body data is received"""
-        # Update last data received timestamp
-        current_time = time.time()
-        self.last_data_received = current_time
+        # Count the packet for the connection health check
+        self._pkt_count += 1
         
         # Check if this is the femur tracker
         if rigid_body_id == self.femur_id:
             # Mark that femur appeared in this frame
             self.femur_in_current_frame = True
             
-            new_position = list(position)
+            current_time = time.monotonic()
+            pose = self._publish_pose(self._FEMUR, position, rotation, current_time)
+            self.femur_data_received = True
             
             # Check if position has actually changed (not stale data)
-            position_changed = False
             if self.previous_femur_position is None:
-                position_changed = True
+                self.previous_femur_position = pose[:3].copy()
             else:
-                # Check if position changed by more than 0.1mm (1e-4 meters)
-                position_diff = np.linalg.norm(np.array(new_position) - np.array(self.previous_femur_position))
-                if position_diff > 1e-4:
-                    position_changed = True
+                # Check if position changed by more than 0.1mm
+                diff = np.subtract(pose[:3], self.previous_femur_position, out=self._femur_position_diff)
+                if diff @ diff > 1e-2:
+                    self.previous_femur_position[:] = pose[:3]
                     self.last_femur_position_change_time = current_time
             
-            self.femur_position = new_position
-            self.femur_rotation = list(rotation)
-            self.femur_data_received = True
-            self.last_femur_data_time = current_time
-            self.previous_femur_position = new_position.copy() if position_changed else self.previous_femur_position
-            
             # No automatic updates for simple visualizer
             
         # Check if this is the stylus
         elif rigid_body_id == self.stylus_id:
-            self.stylus_position = list(position)
-            self.stylus_rotation = list(rotation)
+            self._publish_pose(self._STYLUS, position, rotation, time.monotonic())
             self.stylus_data_received = True
-            self.last_stylus_data_time = current_time
+    
+    def _publish_pose(self, body, position, rotation, timestamp):
+        """
+        Write a pose into the free ring slot of a body and publish it (receive thread only)
+        
+        Returns:
+            The (8,) ring slot that was written
+        """
+        seq = self._seq[body]
+        slot = self._pose_ring[body, (seq + 1) & 1]
+        self.calculator.convert_to_millimeters(position, out=slot[:3])
+        slot[3:7] = rotation
+        slot[7] = timestamp
+        self._seq[body] = (seq + 1) & 0xFFFFFFFF
+        return slot
+    
+    def _read_pose(self, body):
+        """
+        Copy the latest published pose of a body out of the ring
+        
+        Returns:
+            (8,) ndarray [x, y, z, qx, qy, qz, qw, t]
+        """
+        while True:
+            seq = self._seq[body]
+            pose = self._pose_ring[body, seq & 1].copy()
+            # The slot is only rewritten after the sequence has moved on
+            if self._seq[body] == seq:
+                return pose
+    
+    def get_femur_pose(self):
+        """
+        Snapshot the latest femur pose
+        
+        Returns:
+            Tuple (position [x, y, z] in mm, rotation [x, y, z, w]) of arrays
+        """
+        pose = self._read_pose(self._FEMUR)
+        return pose[:3], pose[3:7]
+    
+    def get_stylus_pose(self):
+        """
+        Snapshot the latest stylus pose
+        
+        Returns:
+            Tuple (position [x, y, z] in mm, rotation [x, y, z, w]) of arrays
+        """
+        pose = self._read_pose(self._STYLUS)
+        return pose[:3], pose[3:7]
     
     def on_new_frame_received(self, data_dict):
         """Callback when a new frame is received - reset frame flags"""
@@ -334,13 +429,15 @@ class RigidBodyTracker:
     
     def is_femur_data_fresh(self):
         """Check if femur data is recent (not stale) and actually being tracked"""
-        if not self.femur_data_received or self.femur_position is None:
+        if not self.femur_data_received:
             return False
         
-        current_time = time.time()
+        current_time = time.monotonic()
+        femur_pose = self._read_pose(self._FEMUR)
+        last_femur_data_time = femur_pose[7]
         
         # Check 1: Data must be received recently
-        if (current_time - self.last_femur_data_time) >= self.data_timeout:
+        if (current_time - last_femur_data_time) >= self.data_timeout:
             return False
         
         # Check 2: Position must have changed recently (indicating active tracking)
@@ -351,13 +448,12 @@ class RigidBodyTracker:
             # But still allow if data is being received (might be stationary)
             if (current_time - self.last_femur_position_change_time) >= 2.0:
                 # Only fail if we also haven't received data recently
-                if (current_time - self.last_femur_data_time) >= 0.5:
+                if (current_time - last_femur_data_time) >= 0.5:
                     return False
         
         # Check 3: Validate position values aren't zeros or invalid
-        # If position is all zeros or very close to zero, likely invalid
-        pos_array = np.array(self.femur_position)
-        if np.allclose(pos_array, 0, atol=1e-6):
+        # If position is all zeros or very close to zero, likely invalid (position is in mm)
+        if np.allclose(femur_pose[:3], 0, atol=1e-3):
             return False
         
         # Check 4: Must have appeared in recent frames (if frame listener is working)
@@ -369,43 +465,59 @@ class RigidBodyTracker:
             if not self.femur_in_current_frame:
                 # Only fail if data hasn't been received in a while
                 # This handles timing issues where frame arrives before rigid body callback
-                if (current_time - self.last_femur_data_time) >= 0.3:
+                if (current_time - last_femur_data_time) >= 0.3:
                     return False
         
         return True
     
+    def _now_str(self):
+        """Current local time as 'YYYY-MM-DD HH:MM:SS', formatted at most once per second"""
+        now = int(time.time())
+        second, formatted = self._ts_cache
+        if now != second:
+            formatted = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+            self._ts_cache = (now, formatted)
+        return formatted
+    
+    def _emit(self, lines):
+        """Write a block of report lines to stdout in a single call"""
+        sys.stdout.write('\n'.join(lines) + '\n')
+    
     def capture_positions(self):
         """Capture and print current positions of both rigid bodies"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\n=== POSITION CAPTURE [{timestamp}] ===")
+        buf = []
+        timestamp = self._now_str()
+        buf.append(f"\n=== POSITION CAPTURE [{timestamp}] ===")
         
         # Check connection status
         if not self.connected:
-            print(f"{Colors.RED}{Colors.BOLD}WARNING: Not connected to NatNet server!{Colors.END}")
-            print(f"{Colors.RED}Press 't' to test connection or check your network settings.{Colors.END}")
-            print(f"{Colors.RED}Server IP: {self.client.get_server_address()}{Colors.END}")
-            print("=" * 50)
+            buf.append(f"{Colors.RED}{Colors.BOLD}WARNING: Not connected to NatNet server!{Colors.END}")
+            buf.append(f"{Colors.RED}Press 't' to test connection or check your network settings.{Colors.END}")
+            buf.append(f"{Colors.RED}Server IP: {self.client.get_server_address()}{Colors.END}")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
         # Check femur data
-        if self.femur_data_received and self.femur_position is not None:
-            femur_pos_mm = self.calculator.convert_to_millimeters(self.femur_position)
-            print(f"Femur Tracker (ID {self.femur_id}):")
-            print(f"  Position: X={femur_pos_mm[0]:.2f}mm, Y={femur_pos_mm[1]:.2f}mm, Z={femur_pos_mm[2]:.2f}mm")
-            print(f"  Rotation: W={self.femur_rotation[0]:.3f}, X={self.femur_rotation[1]:.3f}, Y={self.femur_rotation[2]:.3f}, Z={self.femur_rotation[3]:.3f}")
+        if self.femur_data_received:
+            femur_pos_mm, femur_rotation = self.get_femur_pose()
+            buf.append(f"Femur Tracker (ID {self.femur_id}):")
+            buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(femur_pos_mm))
+            buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(femur_rotation))
         else:
-            print(f"Femur Tracker (ID {self.femur_id}): NO DATA")
+            buf.append(f"Femur Tracker (ID {self.femur_id}): NO DATA")
         
         # Check stylus data
-        if self.stylus_data_received and self.stylus_position is not None:
-            stylus_pos_mm = self.calculator.convert_to_millimeters(self.stylus_position)
-            print(f"Stylus (ID {self.stylus_id}):")
-            print(f"  Position: X={stylus_pos_mm[0]:.2f}mm, Y={stylus_pos_mm[1]:.2f}mm, Z={stylus_pos_mm[2]:.2f}mm")
-            print(f"  Rotation: W={self.stylus_rotation[0]:.3f}, X={self.stylus_rotation[1]:.3f}, Y={self.stylus_rotation[2]:.3f}, Z={self.stylus_rotation[3]:.3f}")
+        if self.stylus_data_received:
+            stylus_pos_mm, stylus_rotation = self.get_stylus_pose()
+            buf.append(f"Stylus (ID {self.stylus_id}):")
+            buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(stylus_pos_mm))
+            buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(stylus_rotation))
         else:
-            print(f"Stylus (ID {self.stylus_id}): NO DATA")
+            buf.append(f"Stylus (ID {self.stylus_id}): NO DATA")
         
-        print("=" * 50)
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def calculate_updated_stylus_position(self, reference_position, reference_rotation, reference_stylus_pos, 
                                          new_position, new_rotation):
@@ -417,163 +529,177 @@ class RigidBodyTracker:
     
     def store_positions(self):
         """Store current positions as a data point"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        buf = []
+        timestamp = self._now_str()
         
         # Check if we have both data points
-        if not self.femur_data_received or self.femur_position is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Femur Tracker (ID {self.femur_id}): No data available")
-            print("Cannot store data without femur tracker position.")
-            print("=" * 50)
+        if not self.femur_data_received:
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append(f"Femur Tracker (ID {self.femur_id}): No data available")
+            buf.append("Cannot store data without femur tracker position.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
-        if not self.stylus_data_received or self.stylus_position is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Stylus (ID {self.stylus_id}): No data available")
-            print("Cannot store data without stylus position.")
-            print("=" * 50)
+        if not self.stylus_data_received:
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append(f"Stylus (ID {self.stylus_id}): No data available")
+            buf.append("Cannot store data without stylus position.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
-        # Convert to millimeters for storage
-        femur_pos_mm = self.calculator.convert_to_millimeters(self.femur_position)
-        stylus_pos_mm = self.calculator.convert_to_millimeters(self.stylus_position)
-        
-        # Create data point
-        data_point = {
-            'point_number': len(self.captured_points) + 1,
-            'timestamp': timestamp,
-            'femur_position': femur_pos_mm.copy(),
-            'femur_rotation': self.femur_rotation.copy(),
-            'stylus_position': stylus_pos_mm.copy(),
-            'stylus_rotation': self.stylus_rotation.copy()
-        }
-        
-        # Store the data point
-        self.captured_points.append(data_point)
-        
-        print(f"\n=== DATA POINT STORED [{timestamp}] ===")
-        print(f"Point #{data_point['point_number']} captured:")
-        print(f"Femur Tracker (ID {self.femur_id}):")
-        print(f"  Position: X={femur_pos_mm[0]:.2f}mm, Y={femur_pos_mm[1]:.2f}mm, Z={femur_pos_mm[2]:.2f}mm")
-        print(f"  Rotation: W={self.femur_rotation[0]:.3f}, X={self.femur_rotation[1]:.3f}, Y={self.femur_rotation[2]:.3f}, Z={self.femur_rotation[3]:.3f}")
-        print(f"Stylus (ID {self.stylus_id}):")
-        print(f"  Position: X={stylus_pos_mm[0]:.2f}mm, Y={stylus_pos_mm[1]:.2f}mm, Z={stylus_pos_mm[2]:.2f}mm")
-        print(f"  Rotation: W={self.stylus_rotation[0]:.3f}, X={self.stylus_rotation[1]:.3f}, Y={self.stylus_rotation[2]:.3f}, Z={self.stylus_rotation[3]:.3f}")
-        print(f"Total data points stored: {len(self.captured_points)}")
-        print("=" * 50)
+        # Grow the point buffer geometrically so stores stay amortized O(1)
+        if self._n_pts == len(self._pts):
+            grown = np.empty((2 * len(self._pts), 14))
+            grown[:self._n_pts] = self._pts
+            self._pts = grown
+        
+        # Store both poses straight into the next row (positions in mm)
+        row = self._pts[self._n_pts]
+        row[:7] = self._read_pose(self._FEMUR)[:7]
+        row[7:] = self._read_pose(self._STYLUS)[:7]
+        self._pts_ts.append(timestamp)
+        self._n_pts += 1
+        femur_pos_mm, femur_rotation = row[0:3], row[3:7]
+        stylus_pos_mm, stylus_rotation = row[7:10], row[10:14]
+        
+        buf.append(f"\n=== DATA POINT STORED [{timestamp}] ===")
+        buf.append(f"Point #{self._n_pts} captured:")
+        buf.append(f"Femur Tracker (ID {self.femur_id}):")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(femur_pos_mm))
+        buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(femur_rotation))
+        buf.append(f"Stylus (ID {self.stylus_id}):")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(stylus_pos_mm))
+        buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(stylus_rotation))
+        buf.append(f"Total data points stored: {self._n_pts}")
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def list_stored_points(self):
         """List all stored data points"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\n=== STORED DATA POINTS [{timestamp}] ===")
-        
-        if not self.captured_points:
-            print("No data points stored yet.")
-            print("Use 's' to store current positions as a data point.")
+        buf = []
+        timestamp = self._now_str()
+        buf.append(f"\n=== STORED DATA POINTS [{timestamp}] ===")
+        
+        n = self._n_pts
+        if not n:
+            buf.append("No data points stored yet.")
+            buf.append("Use 's' to store current positions as a data point.")
         else:
-            print(f"Total data points: {len(self.captured_points)}")
-            print()
+            buf.append(f"Total data points: {n}")
+            buf.append("")
             
-            for i, point in enumerate(self.captured_points, 1):
-                print(f"Point #{point['point_number']} - {point['timestamp']}:")
-                print(f"  Femur: X={point['femur_position'][0]:.2f}mm, Y={point['femur_position'][1]:.2f}mm, Z={point['femur_position'][2]:.2f}mm")
-                print(f"  Stylus: X={point['stylus_position'][0]:.2f}mm, Y={point['stylus_position'][1]:.2f}mm, Z={point['stylus_position'][2]:.2f}mm")
-                if i < len(self.captured_points):
-                    print()
-        
-        print("=" * 50)
+            # Pull the position columns out as plain floats in one go
+            femur_positions = self._pts[:n, 0:3].tolist()
+            stylus_positions = self._pts[:n, 7:10].tolist()
+            for i in range(n):
+                buf.append(f"Point #{i + 1} - {self._pts_ts[i]}:")
+                buf.append("  Femur: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(femur_positions[i]))
+                buf.append("  Stylus: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(stylus_positions[i]))
+                if i + 1 < n:
+                    buf.append("")
+        
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def capture_reference(self):
         """Capture reference positions of both tracker and stylus"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        buf = []
+        timestamp = self._now_str()
         
         # Check if we have both data points
-        if not self.femur_data_received or self.femur_position is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Femur Tracker (ID {self.femur_id}): No data available")
-            print("Cannot capture reference without femur tracker position.")
-            print("=" * 50)
+        if not self.femur_data_received:
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append(f"Femur Tracker (ID {self.femur_id}): No data available")
+            buf.append("Cannot capture reference without femur tracker position.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
-        if not self.stylus_data_received or self.stylus_position is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Stylus (ID {self.stylus_id}): No data available")
-            print("Cannot capture reference without stylus position.")
-            print("=" * 50)
+        if not self.stylus_data_received:
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append(f"Stylus (ID {self.stylus_id}): No data available")
+            buf.append("Cannot capture reference without stylus position.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
         # Store reference data
-        self.reference_femur_position = self.calculator.convert_to_millimeters(self.femur_position)
-        self.reference_femur_rotation = self.femur_rotation.copy()
-        self.reference_stylus_position = self.calculator.convert_to_millimeters(self.stylus_position)
-        self.reference_stylus_rotation = self.stylus_rotation.copy()
+        self.reference_femur_position, self.reference_femur_rotation = self.get_femur_pose()
+        self.reference_stylus_position, self.reference_stylus_rotation = self.get_stylus_pose()
         self.reference_captured = True
         
-        print(f"\n=== REFERENCE CAPTURED [{timestamp}] ===")
-        print("Reference positions stored for coordinate calculation:")
-        print(f"Femur Tracker (ID {self.femur_id}):")
-        print(f"  Position: X={self.reference_femur_position[0]:.2f}mm, Y={self.reference_femur_position[1]:.2f}mm, Z={self.reference_femur_position[2]:.2f}mm")
-        print(f"  Rotation: W={self.reference_femur_rotation[0]:.3f}, X={self.reference_femur_rotation[1]:.3f}, Y={self.reference_femur_rotation[2]:.3f}, Z={self.reference_femur_rotation[3]:.3f}")
-        print(f"Stylus (ID {self.stylus_id}):")
-        print(f"  Position: X={self.reference_stylus_position[0]:.2f}mm, Y={self.reference_stylus_position[1]:.2f}mm, Z={self.reference_stylus_position[2]:.2f}mm")
-        print(f"  Rotation: W={self.reference_stylus_rotation[0]:.3f}, X={self.reference_stylus_rotation[1]:.3f}, Y={self.reference_stylus_rotation[2]:.3f}, Z={self.reference_stylus_rotation[3]:.3f}")
-        print("Now move the tracker and press 'u' to calculate updated stylus position!")
-        print("=" * 50)
+        buf.append(f"\n=== REFERENCE CAPTURED [{timestamp}] ===")
+        buf.append("Reference positions stored for coordinate calculation:")
+        buf.append(f"Femur Tracker (ID {self.femur_id}):")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(self.reference_femur_position))
+        buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(self.reference_femur_rotation))
+        buf.append(f"Stylus (ID {self.stylus_id}):")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(self.reference_stylus_position))
+        buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(self.reference_stylus_rotation))
+        buf.append("Now move the tracker and press 'u' to calculate updated stylus position!")
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def calculate_updated_position(self):
         """Calculate and display updated stylus position based on tracker movement"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        buf = []
+        timestamp = self._now_str()
         
         if not self.reference_captured:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print("No reference captured yet.")
-            print("Press 'r' to capture reference positions first.")
-            print("=" * 50)
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append("No reference captured yet.")
+            buf.append("Press 'r' to capture reference positions first.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
-        if not self.femur_data_received or self.femur_position is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Femur Tracker (ID {self.femur_id}): No current data available")
-            print("Cannot calculate updated position without current tracker data.")
-            print("=" * 50)
+        if not self.femur_data_received:
+            buf.append(f"\n=== ERROR [{timestamp}] ===")
+            buf.append(f"Femur Tracker (ID {self.femur_id}): No current data available")
+            buf.append("Cannot calculate updated position without current tracker data.")
+            buf.append("=" * 50)
+            self._emit(buf)
             return
         
         # Get current tracker position in mm
-        current_femur_pos_mm = self.calculator.convert_to_millimeters(self.femur_position)
+        current_femur_pos_mm, femur_rotation = self.get_femur_pose()
         
         # Calculate updated stylus position
         updated_stylus_pos = self.calculate_updated_stylus_position(
             self.reference_femur_position, self.reference_femur_rotation, self.reference_stylus_position,
-            current_femur_pos_mm, self.femur_rotation
+            current_femur_pos_mm, femur_rotation
         )
         
-        print(f"\n=== UPDATED STYLUS POSITION [{timestamp}] ===")
-        print("Calculated stylus position based on tracker movement:")
-        print(f"Femur Tracker (ID {self.femur_id}) - CURRENT:")
-        print(f"  Position: X={current_femur_pos_mm[0]:.2f}mm, Y={current_femur_pos_mm[1]:.2f}mm, Z={current_femur_pos_mm[2]:.2f}mm")
-        print(f"  Rotation: W={self.femur_rotation[0]:.3f}, X={self.femur_rotation[1]:.3f}, Y={self.femur_rotation[2]:.3f}, Z={self.femur_rotation[3]:.3f}")
-        print(f"Stylus (ID {self.stylus_id}) - CALCULATED:")
-        print(f"  Position: X={updated_stylus_pos[0]:.2f}mm, Y={updated_stylus_pos[1]:.2f}mm, Z={updated_stylus_pos[2]:.2f}mm")
+        buf.append(f"\n=== UPDATED STYLUS POSITION [{timestamp}] ===")
+        buf.append("Calculated stylus position based on tracker movement:")
+        buf.append(f"Femur Tracker (ID {self.femur_id}) - CURRENT:")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(current_femur_pos_mm))
+        buf.append("  Rotation: W=%.3f, X=%.3f, Y=%.3f, Z=%.3f" % tuple(femur_rotation))
+        buf.append(f"Stylus (ID {self.stylus_id}) - CALCULATED:")
+        buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(updated_stylus_pos))
         
         # Show actual stylus position if available for comparison
-        if self.stylus_data_received and self.stylus_position is not None:
-            actual_stylus_pos_mm = self.calculator.convert_to_millimeters(self.stylus_position)
+        if self.stylus_data_received:
+            actual_stylus_pos_mm, _ = self.get_stylus_pose()
             error_data = self.calculator.calculate_position_error(updated_stylus_pos, actual_stylus_pos_mm)
             
-            print(f"Stylus (ID {self.stylus_id}) - ACTUAL:")
-            print(f"  Position: X={actual_stylus_pos_mm[0]:.2f}mm, Y={actual_stylus_pos_mm[1]:.2f}mm, Z={actual_stylus_pos_mm[2]:.2f}mm")
-            print()
-            print("=== ERROR ANALYSIS ===")
-            print(f"Position Error (Calculated vs Actual):")
-            print(f"  X-axis error: {error_data['x_error']:+.2f}mm")
-            print(f"  Y-axis error: {error_data['y_error']:+.2f}mm") 
-            print(f"  Z-axis error: {error_data['z_error']:+.2f}mm")
-            print(f"  3D Error Magnitude: {error_data['magnitude']:.2f}mm")
-            print("=" * 25)
+            buf.append(f"Stylus (ID {self.stylus_id}) - ACTUAL:")
+            buf.append("  Position: X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(actual_stylus_pos_mm))
+            buf.append("")
+            buf.append("=== ERROR ANALYSIS ===")
+            buf.append(f"Position Error (Calculated vs Actual):")
+            buf.append(f"  X-axis error: {error_data['x_error']:+.2f}mm")
+            buf.append(f"  Y-axis error: {error_data['y_error']:+.2f}mm")
+            buf.append(f"  Z-axis error: {error_data['z_error']:+.2f}mm")
+            buf.append(f"  3D Error Magnitude: {error_data['magnitude']:.2f}mm")
+            buf.append("=" * 25)
         else:
-            print(f"Stylus (ID {self.stylus_id}): No actual data available for comparison")
+            buf.append(f"Stylus (ID {self.stylus_id}): No actual data available for comparison")
         
-        print("=" * 50)
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def show_connection_animation(self):
         """Show animated connection indicator"""
@@ -587,12 +713,18 @@ class RigidBodyTracker:
         frames = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
         frame_index = int(elapsed * 4) % len(frames)
         
+        # Only redraw when the spinner advances (at most 4 writes per second)
+        if frame_index == self._last_anim_frame:
+            return
+        self._last_anim_frame = frame_index
+        
         # Clear line and show animation
         print(f"\r{Colors.CYAN}{frames[frame_index]} Connecting to NatNet server... ({elapsed:.1f}s){Colors.END}", end='', flush=True)
     
     def start_connection_animation(self):
         """Start the connection animation"""
         self.showing_connection_animation = True
+        self._last_anim_frame = -1
         self.connection_start_time = time.time()
         print(f"\n{Colors.CYAN}Starting connection to NatNet server...{Colors.END}")
     
@@ -602,12 +734,18 @@ class RigidBodyTracker:
             self.showing_connection_animation = False
             print()  # New line after animation
     
-    def is_connection_healthy(self):
-        """Check if the connection to NatNet server is healthy"""
-        current_time = time.time()
+    def is_connection_healthy(self, now=None):
+        """
+        Check if the connection to NatNet server is healthy
+        
+        Args:
+            now (float): time.monotonic() reading to check against; read here if not given
+        """
+        if now is None:
+            now = time.monotonic()
         
         # Check if we've received data recently
-        if current_time - self.last_data_received > self.connection_timeout:
+        if now - self.last_data_received > self.connection_timeout:
             return False
         
         # Check if the client reports being connected
@@ -618,22 +756,32 @@ class RigidBodyTracker:
     
     def update_connection_status(self):
         """Update connection status based on data reception and server communication"""
-        current_time = time.time()
+        current_time = time.monotonic()
+        
+        # Stamp the data reception time if packets arrived since the last call
+        if self._pkt_count != self._pkt_count_at_last_check:
+            self._pkt_count_at_last_check = self._pkt_count
+            self.last_data_received = current_time
         
         # Show connection animation if we're trying to connect
         if self.showing_connection_animation:
             self.show_connection_animation()
         
+        # Report a running connection test once its animation has had its time
+        if self._connection_test_due is not None and current_time >= self._connection_test_due:
+            self._connection_test_due = None
+            self._finish_connection_test()
+        
         # Only check periodically to avoid excessive server calls
         if current_time - self.last_connection_check < self.connection_check_interval:
             return
         
         self.last_connection_check = current_time
         was_connected = self.connected
-        self.connected = self.is_connection_healthy()
+        self.connected = self.is_connection_healthy(current_time)
         
-        # Stop animation if we're connected
-        if self.connected and self.showing_connection_animation:
+        # Stop animation if we're connected (a running connection test stops its own)
+        if self.connected and self.showing_connection_animation and self._connection_test_due is None:
             self.stop_connection_animation()
         
         # Show connection status changes with delays
@@ -647,7 +795,7 @@ class RigidBodyTracker:
     
     def print_connection_lost(self):
         """Print red error message when connection is lost"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self._now_str()
         print(f"\n{Colors.RED}{Colors.BOLD}CONNECTION LOST [{timestamp}]{Colors.END}")
         print(f"{Colors.RED}No data received from NatNet server for {self.connection_timeout} seconds.{Colors.END}")
         print(f"{Colors.YELLOW}This might be normal if:{Colors.END}")
@@ -659,64 +807,72 @@ class RigidBodyTracker:
     
     def print_connection_restored(self):
         """Print green success message when connection is restored"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self._now_str()
         print(f"\n{Colors.GREEN}{Colors.BOLD}CONNECTION RESTORED [{timestamp}]{Colors.END}")
         print(f"{Colors.GREEN}Successfully receiving data from NatNet server.{Colors.END}")
         print("=" * 50)
     
     def check_connection_status(self):
         """Check and display connection status"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\n=== CONNECTION STATUS [{timestamp}] ===")
-        print(f"Connection attempted: {self.connection_attempted}")
+        buf = []
+        timestamp = self._now_str()
+        buf.append(f"\n=== CONNECTION STATUS [{timestamp}] ===")
+        buf.append(f"Connection attempted: {self.connection_attempted}")
         
         if self.connected:
-            print(f"{Colors.GREEN}Connected: {self.connected}{Colors.END}")
-            print(f"{Colors.GREEN}✓ Successfully connected to NatNet server{Colors.END}")
+            buf.append(f"{Colors.GREEN}Connected: {self.connected}{Colors.END}")
+            buf.append(f"{Colors.GREEN}✓ Successfully connected to NatNet server{Colors.END}")
         else:
-            print(f"{Colors.RED}Connected: {self.connected}{Colors.END}")
+            buf.append(f"{Colors.RED}Connected: {self.connected}{Colors.END}")
             if self.connection_attempted:
-                print(f"{Colors.RED}✗ Connection attempted but failed{Colors.END}")
+                buf.append(f"{Colors.RED}✗ Connection attempted but failed{Colors.END}")
             else:
-                print(f"{Colors.YELLOW}⚠ No connection attempt made yet{Colors.END}")
+                buf.append(f"{Colors.YELLOW}⚠ No connection attempt made yet{Colors.END}")
         
-        print(f"Server IP: {self.client.get_server_address()}")
-        print(f"Local IP: {self.client.local_ip_address}")
-        print(f"Multicast enabled: {self.client.get_use_multicast()}")
+        buf.append(f"Server IP: {self.client.get_server_address()}")
+        buf.append(f"Local IP: {self.client.local_ip_address}")
+        buf.append(f"Multicast enabled: {self.client.get_use_multicast()}")
         
         # Show additional connection info if available
         try:
             app_name = self.client.get_application_name()
             if app_name != "Not Set":
-                print(f"Application: {app_name}")
+                buf.append(f"Application: {app_name}")
             server_version = self.client.get_server_version()
             if server_version != (0, 0, 0, 0):
-                print(f"Server Version: {server_version}")
+                buf.append(f"Server Version: {server_version}")
         except:
             pass
         
         # Show data reception status
-        current_time = time.time()
+        current_time = time.monotonic()
         time_since_data = current_time - self.last_data_received
         if self.last_data_received > 0:
             if time_since_data < self.connection_timeout:
-                print(f"{Colors.GREEN}Last data received: {time_since_data:.1f} seconds ago{Colors.END}")
+                buf.append(f"{Colors.GREEN}Last data received: {time_since_data:.1f} seconds ago{Colors.END}")
             else:
-                print(f"{Colors.RED}Last data received: {time_since_data:.1f} seconds ago (TIMEOUT){Colors.END}")
+                buf.append(f"{Colors.RED}Last data received: {time_since_data:.1f} seconds ago (TIMEOUT){Colors.END}")
         else:
-            print(f"{Colors.RED}No data received yet{Colors.END}")
+            buf.append(f"{Colors.RED}No data received yet{Colors.END}")
         
-        print("=" * 50)
+        buf.append("=" * 50)
+        self._emit(buf)
     
     def test_connection(self):
-        """Test connection to NatNet server"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        """
+        Test connection to NatNet server. Starts the animation and returns right away;
+        update_connection_status reports the result 2 seconds later, so the main loop
+        keeps running (and the spinner animating) meanwhile.
+        """
+        timestamp = self._now_str()
         print(f"\n=== CONNECTION TEST [{timestamp}] ===")
         
         # Show animation while testing
         self.start_connection_animation()
-        time.sleep(2)  # Give it a moment to show animation
-        
+        self._connection_test_due = time.monotonic() + 2.0  # Give it a moment to show animation
+    
+    def _finish_connection_test(self):
+        """Report the result of the connection test started by test_connection"""
         try:
             # Check if client reports being connected
             is_connected = self.client.connected()
@@ -747,33 +903,33 @@ class RigidBodyTracker:
     
     def export_data_points(self):
         """Export all stored data points to a CSV file"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self._now_str()
         
-        if not self.captured_points:
+        n = self._n_pts
+        if not n:
             print(f"\n=== ERROR [{timestamp}] ===")
             print("No data points to export.")
             print("Use 's' to store some data points first.")
             print("=" * 50)
             return
         # Generate filename with timestamp
-        export_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        export_timestamp = time.strftime('%Y%m%d_%H%M%S')
         filename = f"rigid_body_data_{export_timestamp}.csv"
         
         try:
+            # One row per point: number, timestamp, then the 14 position/rotation values
+            rows = np.empty((n, 16), dtype=object)
+            rows[:, 0] = np.arange(1, n + 1)
+            rows[:, 1] = self._pts_ts
+            rows[:, 2:] = self._pts[:n]
+            row_format = ','.join(['%d', '%s'] + ['%.3f'] * 3 + ['%.6f'] * 4 + ['%.3f'] * 3 + ['%.6f'] * 4)
+            
             with open(filename, 'w', newline='') as csvfile:
-                # Write header
-                csvfile.write("Point_Number,Timestamp,Femur_X_mm,Femur_Y_mm,Femur_Z_mm,Femur_W,Femur_X,Femur_Y,Femur_Z,Stylus_X_mm,Stylus_Y_mm,Stylus_Z_mm,Stylus_W,Stylus_X,Stylus_Y,Stylus_Z\n")
-                
-                # Write data points
-                for point in self.captured_points:
-                    csvfile.write(f"{point['point_number']},{point['timestamp']},")
-                    csvfile.write(f"{point['femur_position'][0]:.3f},{point['femur_position'][1]:.3f},{point['femur_position'][2]:.3f},")
-                    csvfile.write(f"{point['femur_rotation'][0]:.6f},{point['femur_rotation'][1]:.6f},{point['femur_rotation'][2]:.6f},{point['femur_rotation'][3]:.6f},")
-                    csvfile.write(f"{point['stylus_position'][0]:.3f},{point['stylus_position'][1]:.3f},{point['stylus_position'][2]:.3f},")
-                    csvfile.write(f"{point['stylus_rotation'][0]:.6f},{point['stylus_rotation'][1]:.6f},{point['stylus_rotation'][2]:.6f},{point['stylus_rotation'][3]:.6f}\n")
+                np.savetxt(csvfile, rows, fmt=row_format, comments='',
+                           header="Point_Number,Timestamp,Femur_X_mm,Femur_Y_mm,Femur_Z_mm,Femur_W,Femur_X,Femur_Y,Femur_Z,Stylus_X_mm,Stylus_Y_mm,Stylus_Z_mm,Stylus_W,Stylus_X,Stylus_Y,Stylus_Z")
             
             print(f"\n=== DATA EXPORTED [{timestamp}] ===")
-            print(f"Successfully exported {len(self.captured_points)} data points to: {filename}")
+            print(f"Successfully exported {n} data points to: {filename}")
             print("File format: CSV with columns for positions (mm) and rotations (quaternions)")
             print("=" * 50)
             
@@ -782,6 +938,48 @@ class RigidBodyTracker:
             print(f"Failed to export data: {e}")
             print("=" * 50)
     
+    def calculate_all_mapped_points(self, csv_filename='Attune_5_Left_Points.csv'):
+        """
+        Calculate the positions of every mapped point in the CSV (L1-L10, M1-M10) in one batch
+        
+        Args:
+            csv_filename (str): Path to CSV file with reference data
+        
+        Returns:
+            dict: Point labels in CSV order and their (N, 3) calculated positions in mm,
+            or a dict with 'error' if the femur is not visible or the CSV can't be read
+        """
+        if not self.is_femur_data_fresh():
+            error_msg = "the object is not visible to the camera"
+            print(error_msg)
+            return {'error': error_msg}
+        
+        try:
+            # Imported here so starting the tracker doesn't load the CSV helpers
+            from visualize_points import load_reference_points
+            reference = load_reference_points(csv_filename)
+        except FileNotFoundError:
+            error_msg = f"CSV file not found: {csv_filename}"
+            print(error_msg)
+            return {'error': error_msg}
+        except Exception as e:
+            error_msg = f"Error reading CSV file: {e}"
+            print(error_msg)
+            return {'error': error_msg}
+        
+        current_femur_pos_mm, current_femur_rotation = self.get_femur_pose()
+        positions_mm = self.calculator.calculate_updated_stylus_positions(
+            reference['femur'], reference['rotation'], reference['stylus'],
+            current_femur_pos_mm, current_femur_rotation
+        )
+        
+        return {
+            'success': True,
+            'point_labels': list(reference['labels']),
+            'calculated_positions_mm': positions_mm,
+            'current_femur_pos_mm': current_femur_pos_mm
+        }
+    
     def calculate_mapped_point(self, point_label, csv_filename='Attune_5_Left_Points.csv'):
         """
         Calculate the position of a specific mapped point (L1-L10 or M1-M10) based on current tracked femur data
@@ -793,7 +991,7 @@ class RigidBodyTracker:
         Returns:
             dict: Dictionary with calculated position and reference data, or None if point not found
         """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self._now_str()
         
         # Check if we have current femur data that is fresh (not stale)
         if not self.is_femur_data_fresh():
@@ -801,27 +999,11 @@ class RigidBodyTracker:
             print(error_msg)
             return {'error': error_msg}
         
-        # Load reference data from CSV
+        # Load reference data from CSV (parsed once per file version)
         try:
-            points = {}
-            with open(csv_filename, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    point_number = row['Point_Number']
-                    femur_pos = [
-                        float(row['Femur_Pos_X_mm']),
-                        float(row['Femur_Pos_Y_mm']),
-                        float(row['Femur_Pos_Z_mm'])
-                    ]
-                    stylus_pos = [
-                        float(row['Stylus_Pos_X_mm']),
-                        float(row['Stylus_Pos_Y_mm']),
-                        float(row['Stylus_Pos_Z_mm'])
-                    ]
-                    points[point_number] = {
-                        'femur': femur_pos,
-                        'stylus': stylus_pos
-                    }
+            # Imported here so starting the tracker doesn't load the CSV helpers
+            from visualize_points import load_reference_points
+            reference = load_reference_points(csv_filename)
         except FileNotFoundError:
             error_msg = f"CSV file not found: {csv_filename}"
             print(f"\n=== ERROR [{timestamp}] ===")
@@ -836,9 +1018,10 @@ class RigidBodyTracker:
             return {'error': error_msg}
         
         # Check if requested point exists
-        if point_label not in points:
+        row = reference['index'].get(point_label)
+        if row is None:
             error_msg = f"Point '{point_label}' not found in CSV file"
-            available_points = ', '.join(sorted(points.keys()))
+            available_points = ', '.join(sorted(reference['index']))
             full_msg = f"{error_msg}. Available points: {available_points}"
             print(f"\n=== ERROR [{timestamp}] ===")
             print(full_msg)
@@ -846,31 +1029,12 @@ class RigidBodyTracker:
             return {'error': full_msg}
         
         # Get reference data for the requested point
-        ref_femur_pos_mm = points[point_label]['femur']
-        ref_stylus_pos_mm = points[point_label]['stylus']
-        
-        # Get femur rotation from CSV
-        femur_rotation = None
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['Point_Number'] == point_label:
-                    femur_rotation = [
-                        float(row['Femur_Rot_W']),
-                        float(row['Femur_Rot_X']),
-                        float(row['Femur_Rot_Y']),
-                        float(row['Femur_Rot_Z'])
-                    ]
-                    break
-        
-        if femur_rotation is None:
-            print(f"\n=== ERROR [{timestamp}] ===")
-            print(f"Could not find femur rotation for point '{point_label}'")
-            print("=" * 50)
-            return None
+        ref_femur_pos_mm = reference['femur'][row]
+        ref_stylus_pos_mm = reference['stylus'][row]
+        femur_rotation = reference['rotation'][row]
         
-        # Convert current femur position to millimeters for calculations
-        current_femur_pos_mm = self.calculator.convert_to_millimeters(self.femur_position)
+        # Current femur position (mm) and rotation
+        current_femur_pos_mm, current_femur_rotation = self.get_femur_pose()
         
         # Calculate updated stylus position
         calculated_position_mm = self.calculator.calculate_updated_stylus_position(
@@ -878,17 +1042,18 @@ class RigidBodyTracker:
             femur_rotation,             # Reference femur rotation (quaternion)
             ref_stylus_pos_mm,         # Reference stylus position (mm)
             current_femur_pos_mm,      # Current femur position (mm)
-            self.femur_rotation        # Current femur rotation (quaternion)
+            current_femur_rotation     # Current femur rotation (quaternion)
         )
         
         # Calculate 4x4 transformation matrix
         # The matrix represents the transformation from the tracked femur position to the calculated stylus position
         # Current rotation matrix from the femur tracker
-        current_rotation_matrix = self.calculator.quaternion_to_rotation_matrix(self.femur_rotation)
+        current_rotation_matrix = self.calculator.quaternion_to_rotation_matrix(current_femur_rotation)
         
         # Create 4x4 transformation matrix [R|t; 0|1]
-        # This matrix transforms from femur tracker frame to the calculated stylus position
-        transformation_matrix = np.zeros((4, 4))
+        # This matrix transforms from femur tracker frame to the calculated stylus position.
+        # Every cell is assigned below, so skip zero-filling it
+        transformation_matrix = np.empty((4, 4))
         
         # Rotation part (3x3)
         transformation_matrix[0:3, 0:3] = current_rotation_matrix
@@ -897,7 +1062,7 @@ class RigidBodyTracker:
         transformation_matrix[0:3, 3] = calculated_position_mm
         
         # Bottom row [0, 0, 0, 1]
-        transformation_matrix[3, 3] = 1.0
+        transformation_matrix[3] = (0.0, 0.0, 0.0, 1.0)
         
         # Output only the 4x4 matrix values separated by commas (row-major order)
         matrix_values = []
@@ -906,40 +1071,30 @@ class RigidBodyTracker:
                 matrix_values.append(str(transformation_matrix[i, j]))
         result_string = ','.join(matrix_values)
         print(result_string)
+        
+        if self.verbose:
+            buf = []
+            buf.append(f"\n=== CALCULATED POSITION FOR {point_label} [{timestamp}] ===")
+            buf.append("Current Femur Position:")
+            buf.append("  X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(current_femur_pos_mm))
+            buf.append("Calculated Position:")
+            buf.append("  X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(calculated_position_mm))
+            buf.append(f"Reference Femur Position (from {csv_filename}):")
+            buf.append("  X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(ref_femur_pos_mm))
+            buf.append(f"Reference Stylus Position (from {csv_filename}):")
+            buf.append("  X=%.2fmm, Y=%.2fmm, Z=%.2fmm" % tuple(ref_stylus_pos_mm))
+            buf.append("")
+            buf.append("4x4 Transformation Matrix:")
+            buf.append(np.array2string(transformation_matrix, precision=6, suppress_small=True))
+            buf.append("=" * 50)
+            self._emit(buf)
+        
         return {
             'success': True,
             'matrix': result_string,
             'point_label': point_label,
             'calculated_position_mm': calculated_position_mm,
-            'transformation_matrix': transformation_matrix.tolist(),
-            'current_femur_pos_mm': current_femur_pos_mm,
-            'reference_femur_pos_mm': ref_femur_pos_mm,
-            'reference_stylus_pos_mm': ref_stylus_pos_mm,
-            'reference_femur_rotation': femur_rotation
-        }
-        # Original verbose output removed - now only prints comma-separated matrix values
-        if False:  # This block never executes, keeping for reference
-            print(f"\n=== CALCULATED POSITION FOR {point_label} [{timestamp}] ===")
-        print(f"Current Femur Position:")
-        print(f"  X={current_femur_pos_mm[0]:.2f}mm, Y={current_femur_pos_mm[1]:.2f}mm, Z={current_femur_pos_mm[2]:.2f}mm")
-        print(f"Calculated Position:")
-        print(f"  X={calculated_position_mm[0]:.2f}mm, Y={calculated_position_mm[1]:.2f}mm, Z={calculated_position_mm[2]:.2f}mm")
-        print(f"Reference Femur Position (from {csv_filename}):")
-        print(f"  X={ref_femur_pos_mm[0]:.2f}mm, Y={ref_femur_pos_mm[1]:.2f}mm, Z={ref_femur_pos_mm[2]:.2f}mm")
-        print(f"Reference Stylus Position (from {csv_filename}):")
-        print(f"  X={ref_stylus_pos_mm[0]:.2f}mm, Y={ref_stylus_pos_mm[1]:.2f}mm, Z={ref_stylus_pos_mm[2]:.2f}mm")
-        print()
-        print(f"4x4 Transformation Matrix:")
-        print(f"  [{transformation_matrix[0,0]:10.6f}  {transformation_matrix[0,1]:10.6f}  {transformation_matrix[0,2]:10.6f}  {transformation_matrix[0,3]:10.3f}]")
-        print(f"  [{transformation_matrix[1,0]:10.6f}  {transformation_matrix[1,1]:10.6f}  {transformation_matrix[1,2]:10.6f}  {transformation_matrix[1,3]:10.3f}]")
-        print(f"  [{transformation_matrix[2,0]:10.6f}  {transformation_matrix[2,1]:10.6f}  {transformation_matrix[2,2]:10.6f}  {transformation_matrix[2,3]:10.3f}]")
-        print(f"  [{transformation_matrix[3,0]:10.6f}  {transformation_matrix[3,1]:10.6f}  {transformation_matrix[3,2]:10.6f}  {transformation_matrix[3,3]:10.3f}]")
-        print("=" * 50)
-        
-        return {
-            'point_label': point_label,
-            'calculated_position_mm': calculated_position_mm,
-            'transformation_matrix': transformation_matrix.tolist(),
+            'transformation_matrix': transformation_matrix,
             'current_femur_pos_mm': current_femur_pos_mm,
             'reference_femur_pos_mm': ref_femur_pos_mm,
             'reference_stylus_pos_mm': ref_stylus_pos_mm,
@@ -947,73 +1102,111 @@ class RigidBodyTracker:
         }
     
     def keyboard_input_handler(self):
-        """Handle keyboard input in a separate thread"""
+        """
+        Read keyboard input in a separate thread (used where stdin can't be polled).
+        Lines are queued and run by the main loop, so commands always run on the main thread.
+        """
         while self.running:
             try:
-                user_input = input().strip()
-                
-                # Split input into command and arguments
-                parts = user_input.split(maxsplit=1)
-                key = parts[0].lower()
-                args = parts[1].strip().upper() if len(parts) > 1 else None
-                
-                if key == 'c':
-                    self.capture_positions()
-                elif key == 's':
-                    self.store_positions()
-                elif key == 'l':
-                    self.list_stored_points()
-                elif key == 'e':
-                    self.export_data_points()
-                elif key == 'r':
-                    self.capture_reference()
-                elif key == 'u':
-                    self.calculate_updated_position()
-                elif key == 't':
-                    self.test_connection()
-                elif key == 'p':
-                    # Calculate mapped point - support both 'p L1' and just 'p'
-                    if args:
-                        # Single line command: 'p L1'
-                        point_label = args
-                        self.calculate_mapped_point(point_label)
-                    else:
-                        # Fallback to interactive prompt
-                        print("\nEnter point label to calculate (e.g., L1, M5):")
-                        point_label = input().strip().upper()
-                        self.calculate_mapped_point(point_label)
-                elif key == 'v':
-                    # Show visualization
-                    if self.femur_data_received and self.femur_position is not None:
-                        print("Generating visualization...")
-                        self.visualizer.show_visualization(self.femur_position, self.femur_rotation)
-                    else:
-                        print("No tracker data available. Press 'c' to check data status.")
-                elif key == 'q':
-                    print("Quitting...")
-                    self.running = False
-                    # No cleanup needed for simple visualizer
-                    break
-                elif key == 'h':
-                    print("\nKeyboard Controls:")
-                    print("  'c' - Capture and print current positions")
-                    print("  's' - Store current positions as a data point")
-                    print("  'l' - List all stored data points")
-                    print("  'e' - Export data points to file")
-                    print("  'r' - Capture reference positions for coordinate calculation")
-                    print("  'u' - Calculate updated stylus position based on tracker movement")
-                    print("  'p <point>' - Calculate mapped point position (e.g., 'p L1', 'p M5')")
-                    print("  'v' - Show visualization (sphere + L-M planes)")
-                    print("  't' - Test connection to NatNet server")
-                    print("  'q' - Quit the program")
-                    print("  'h' - Show this help")
-                else:
-                    print(f"Unknown command: '{user_input}'. Press 'h' for help.")
-                    
+                user_input = input()
             except EOFError:
                 break
-            except Exception as e:
-                print(f"Keyboard input error: {e}")
+            self._keyboard_lines.put(user_input)
+    
+    def _keyboard_mapped_point(self, args):
+        """Calculate a mapped point - supports both 'p L1' and just 'p'"""
+        if args:
+            # Single line command: 'p L1'
+            self.calculate_mapped_point(args)
+        else:
+            # Prompt, and take the label from the next input line rather than blocking
+            # the main loop on input()
+            print("\nEnter point label to calculate (e.g., L1, M5):")
+            self._awaiting_point_label = True
+    
+    def _keyboard_visualize(self):
+        """Show the visualization for the current femur pose"""
+        if self.femur_data_received:
+            print("Generating visualization...")
+            femur_pos_mm, femur_rotation = self.get_femur_pose()
+            self.visualizer.show_visualization(
+                self.calculator.convert_to_meters(femur_pos_mm), femur_rotation
+            )
+        else:
+            print("No tracker data available. Press 'c' to check data status.")
+    
+    def _keyboard_quit(self):
+        """Stop the tracker"""
+        print("Quitting...")
+        self.running = False
+        # No cleanup needed for simple visualizer
+    
+    def _keyboard_help(self):
+        """Print the keyboard controls"""
+        print("\nKeyboard Controls:")
+        print("  'c' - Capture and print current positions")
+        print("  's' - Store current positions as a data point")
+        print("  'l' - List all stored data points")
+        print("  'e' - Export data points to file")
+        print("  'r' - Capture reference positions for coordinate calculation")
+        print("  'u' - Calculate updated stylus position based on tracker movement")
+        print("  'p <point>' - Calculate mapped point position (e.g., 'p L1', 'p M5')")
+        print("  'v' - Show visualization (sphere + L-M planes)")
+        print("  't' - Test connection to NatNet server")
+        print("  'q' - Quit the program")
+        print("  'h' - Show this help")
+    
+    def handle_keyboard_command(self, user_input):
+        """
+        Run one line of keyboard input
+        
+        Args:
+            user_input (str): Line typed by the user (e.g., 'c', 'p L1')
+        """
+        try:
+            user_input = user_input.strip()
+            
+            # Answer to the prompt of a bare 'p'
+            if self._awaiting_point_label:
+                self._awaiting_point_label = False
+                self.calculate_mapped_point(user_input.upper())
+                return
+            
+            # Split input into command and arguments
+            parts = user_input.split(maxsplit=1)
+            key = parts[0].lower()
+            args = parts[1].strip().upper() if len(parts) > 1 else None
+            
+            # 'p' is the only command that takes an argument
+            if key == 'p':
+                self._keyboard_mapped_point(args)
+                return
+            
+            handler = self._keyboard_commands.get(key)
+            if handler is not None:
+                handler()
+            else:
+                print(f"Unknown command: '{user_input}'. Press 'h' for help.")
+                
+        except EOFError:
+            pass
+        except Exception as e:
+            print(f"Keyboard input error: {e}")
+    
+    def _read_stdin_lines(self):
+        """
+        Read what is available on stdin once select() reports it readable
+        
+        Returns:
+            list: Complete lines received so far (possibly empty), or None at end of input
+        """
+        # Read the descriptor directly: lines left in sys.stdin's buffer wouldn't wake select()
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            return None
+        
+        *lines, self._stdin_pending = (self._stdin_pending + data.decode(errors='replace')).split('\n')
+        return lines
     
     def process_command(self, user_input):
         """
@@ -1057,11 +1250,11 @@ class RigidBodyTracker:
                 if not self.is_femur_data_fresh():
                     return "Error: Femur tracker not visible"
                 
-                femur_pos_mm = self.calculator.convert_to_millimeters(self.femur_position)
+                femur_pos_mm, _ = self.get_femur_pose()
                 result = f"Femur (ID {self.femur_id}): X={femur_pos_mm[0]:.2f}mm, Y={femur_pos_mm[1]:.2f}mm, Z={femur_pos_mm[2]:.2f}mm"
                 
-                if self.stylus_data_received and self.stylus_position is not None:
-                    stylus_pos_mm = self.calculator.convert_to_millimeters(self.stylus_position)
+                if self.stylus_data_received:
+                    stylus_pos_mm, _ = self.get_stylus_pose()
                     result += f"\nStylus (ID {self.stylus_id}): X={stylus_pos_mm[0]:.2f}mm, Y={stylus_pos_mm[1]:.2f}mm, Z={stylus_pos_mm[2]:.2f}mm"
                 else:
                     result += "\nStylus: No data"
@@ -1154,9 +1347,24 @@ class RigidBodyTracker:
                 print("Waiting for rigid body data...")
                 print("Press 'c' to capture positions, 't' to test connection, 'q' to quit, or Ctrl+C to stop")
                 
-                # Start keyboard input thread
-                self.keyboard_thread = threading.Thread(target=self.keyboard_input_handler, daemon=True)
-                self.keyboard_thread.start()
+                # Poll stdin from the loop below where the platform allows it. select() only
+                # handles sockets on Windows, and epoll refuses regular files and /dev/null
+                # (stdin of a service, nohup or '< file'), so a keyboard thread feeds the
+                # loop in those cases instead
+                stdin_selector = None
+                if os.name != 'nt':
+                    stdin_selector = selectors.DefaultSelector()
+                    try:
+                        stdin_selector.register(sys.stdin, selectors.EVENT_READ)
+                    except (OSError, ValueError):
+                        stdin_selector.close()
+                        stdin_selector = None
+                if stdin_selector is None:
+                    self.keyboard_thread = threading.Thread(target=self.keyboard_input_handler, daemon=True)
+                    self.keyboard_thread.start()
+                
+                # Compile the calculations in the background while data starts arriving
+                threading.Thread(target=self._warm_up_calculations, daemon=True).start()
                 
                 # Start UDP server thread
                 self.udp_thread = threading.Thread(target=self.udp_server_handler, daemon=True)
@@ -1167,7 +1375,26 @@ class RigidBodyTracker:
                     while self.running:
                         # Update connection status periodically
                         self.update_connection_status()
-                        time.sleep(0.1)
+                        
+                        # Keep an open visualization window responsive between 'v' presses
+                        if self._visualizer is not None:
+                            self._visualizer.process_events()
+                        
+                        if stdin_selector is None:
+                            # Run lines queued by the keyboard thread (if there is one)
+                            try:
+                                self.handle_keyboard_command(self._keyboard_lines.get(timeout=0.1))
+                            except queue.Empty:
+                                pass
+                        elif stdin_selector.select(timeout=0.1):
+                            lines = self._read_stdin_lines()
+                            if lines is None:
+                                # stdin closed; stop polling it and keep tracking
+                                stdin_selector.close()
+                                stdin_selector = None
+                            else:
+                                for user_input in lines:
+                                    self.handle_keyboard_command(user_input)
                 except KeyboardInterrupt:
                     print("\nStopping client...")
                     self.running = False
@@ -1201,6 +1428,8 @@ def main():
                            help=f'Server IP address (default: {DEFAULT_SERVER_IP})')
         parser.add_argument('--local', type=str, default=DEFAULT_LOCAL_IP, 
                            help=f'Local IP address (default: {DEFAULT_LOCAL_IP})')
+        parser.add_argument('--verbose', action='store_true',
+                           help='Print the full report for mapped points, not just the matrix')
         
         args = parser.parse_args()
         
@@ -1214,7 +1443,8 @@ def main():
         # Create and configure the tracker
         print("Creating tracker...")
         tracker = RigidBodyTracker(femur_id=args.femur, stylus_id=args.stylus, 
-                                        server_ip=args.server, local_ip=args.local)
+                                        server_ip=args.server, local_ip=args.local,
+                                        verbose=args.verbose)
         
         print("Setting up connection...")
         tracker.setup_connection()
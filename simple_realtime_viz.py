@@ -5,101 +5,86 @@ A more robust version that avoids threading issues
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import csv
 from position_calculations import PositionCalculator
+from visualize_points import load_reference_points
 
 class SimpleRealtimeViz:
     def __init__(self, csv_filename='Attune_5_Left_Points.csv'):
         self.csv_filename = csv_filename
         self.calculator = PositionCalculator()
-        self.reference_data = {}
+        
+        # Reference table as parallel arrays, one row per CSV point
+        self.labels = np.empty(0, dtype=str)
+        self.femur_pos = np.empty((0, 3))
+        self.femur_rot = np.empty((0, 4))
+        self.stylus_pos = np.empty((0, 3))
+        self.delta_local = np.empty((0, 3))
         self.load_reference_data()
         
+        # The tracker sphere mesh is fixed, so build it once and only translate it when drawing
+        u = np.linspace(0, 2 * np.pi, 20)
+        v = np.linspace(0, np.pi, 20)
+        self._sphere_base_x = 10 * np.outer(np.cos(u), np.sin(v))
+        self._sphere_base_y = 10 * np.outer(np.sin(u), np.sin(v))
+        self._sphere_base_z = 10 * np.outer(np.ones(np.size(u)), np.cos(v))
+        
+        # Figure and artists are created on first use and reused while the window exists
+        self.fig = None
+        self.ax = None
+        self.sphere_artist = None
+        self.l_scatter = None
+        self.m_scatter = None
+        self.link_lines = None
+        self._view_center = None
+        
     def load_reference_data(self):
         """Load reference data from CSV file"""
-        self.reference_data = {}
-        
         try:
-            with open(self.csv_filename, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    point_number = row['Point_Number']
-                    
-                    # Extract femur position and rotation
-                    femur_pos = [
-                        float(row['Femur_Pos_X_mm']),
-                        float(row['Femur_Pos_Y_mm']),
-                        float(row['Femur_Pos_Z_mm'])
-                    ]
-                    femur_rot = [
-                        float(row['Femur_Rot_W']),
-                        float(row['Femur_Rot_X']),
-                        float(row['Femur_Rot_Y']),
-                        float(row['Femur_Rot_Z'])
-                    ]
-                    
-                    # Extract stylus position
-                    stylus_pos = [
-                        float(row['Stylus_Pos_X_mm']),
-                        float(row['Stylus_Pos_Y_mm']),
-                        float(row['Stylus_Pos_Z_mm'])
-                    ]
-                    
-                    self.reference_data[point_number] = {
-                        'femur_pos': femur_pos,
-                        'femur_rot': femur_rot,
-                        'stylus_pos': stylus_pos
-                    }
-                    
+            # Parsed once per file version and shared with the tracker
+            reference = load_reference_points(self.csv_filename)
         except FileNotFoundError:
             print(f"Error: CSV file {self.csv_filename} not found")
-            self.reference_data = {}
+            return
         except Exception as e:
             print(f"Error loading reference data: {e}")
-            self.reference_data = {}
+            return
+        
+        self.labels = np.array(reference['labels'], dtype=str)
+        self.femur_pos = reference['femur']
+        self.femur_rot = reference['rotation']
+        self.stylus_pos = reference['stylus']
+        
+        # Rows of the complete L-M pairs, interleaved L1, M1, L2, M2, ... so all
+        # points can be transformed in one batch
+        row = reference['index']
+        pair_rows = [row[label] for i in range(1, 11) if f'L{i}' in row and f'M{i}' in row
+                     for label in (f'L{i}', f'M{i}')]
+        
+        # The reference poses never change, so rotate each stylus offset back into the
+        # tracker's local frame (by the conjugate reference quaternion) once here
+        self.delta_local = self.calculator.rotate_by_quat(
+            self.calculator.quat_conj(self.femur_rot[pair_rows]),
+            self.stylus_pos[pair_rows] - self.femur_pos[pair_rows]
+        ).reshape(-1, 3)
     
     def calculate_updated_positions(self, current_femur_pos_meters, current_femur_rot_quat):
         """Calculate updated positions for all L-M pairs"""
-        if not current_femur_pos_meters or not current_femur_rot_quat:
+        if current_femur_pos_meters is None or current_femur_rot_quat is None:
             return None, None
             
         # Convert current position to mm
         current_femur_pos_mm = self.calculator.convert_to_millimeters(current_femur_pos_meters)
         
-        # Calculate L-M pairs
-        l_positions = []
-        m_positions = []
+        # Rotate the cached local offsets by the current pose in one batch; rows alternate L, M
+        positions = self.calculator.update_all_styluses(
+            current_femur_pos_mm, current_femur_rot_quat, self.delta_local
+        )
         
-        for i in range(1, 11):
-            l_label = f'L{i}'
-            m_label = f'M{i}'
-            
-            if l_label in self.reference_data and m_label in self.reference_data:
-                # Get reference data
-                l_ref = self.reference_data[l_label]
-                m_ref = self.reference_data[m_label]
-                
-                # Calculate updated positions
-                l_pos = self.calculator.calculate_updated_stylus_position(
-                    l_ref['femur_pos'], l_ref['femur_rot'], l_ref['stylus_pos'],
-                    current_femur_pos_mm, current_femur_rot_quat
-                )
-                
-                m_pos = self.calculator.calculate_updated_stylus_position(
-                    m_ref['femur_pos'], m_ref['femur_rot'], m_ref['stylus_pos'],
-                    current_femur_pos_mm, current_femur_rot_quat
-                )
-                
-                l_positions.append(l_pos)
-                m_positions.append(m_pos)
-        
-        return l_positions, m_positions
+        return positions[0::2], positions[1::2]
     
     def show_visualization(self, current_femur_pos_meters, current_femur_rot_quat):
         """Show a single visualization frame"""
-        if not current_femur_pos_meters or not current_femur_rot_quat:
+        if current_femur_pos_meters is None or current_femur_rot_quat is None:
             print("No tracker data available for visualization")
             return
             
@@ -108,60 +93,89 @@ class SimpleRealtimeViz:
             current_femur_pos_meters, current_femur_rot_quat
         )
         
-        if not l_positions or not m_positions:
+        if len(l_positions) == 0 or len(m_positions) == 0:
             print("No reference data available for visualization")
             return
         
         # Convert tracker position to mm
         femur_pos_mm = self.calculator.convert_to_millimeters(current_femur_pos_meters)
         
-        # Create the plot
-        fig = plt.figure(figsize=(12, 10))
-        ax = fig.add_subplot(111, projection='3d')
+        import matplotlib.pyplot as plt
+        
+        # Reuse the figure while its window is open; build it again once it was closed
+        if self.fig is None or not plt.fignum_exists(self.fig.number):
+            self._create_figure()
+        fig, ax = self.fig, self.ax
+        
+        # Surfaces can't be moved in place, so replace the tracker sphere
+        if self.sphere_artist is not None:
+            self.sphere_artist.remove()
         
         # Draw tracker center as sphere
-        u = np.linspace(0, 2 * np.pi, 20)
-        v = np.linspace(0, np.pi, 20)
-        x_sphere = 10 * np.outer(np.cos(u), np.sin(v)) + femur_pos_mm[0]
-        y_sphere = 10 * np.outer(np.sin(u), np.sin(v)) + femur_pos_mm[1]
-        z_sphere = 10 * np.outer(np.ones(np.size(u)), np.cos(v)) + femur_pos_mm[2]
-        
-        ax.plot_surface(x_sphere, y_sphere, z_sphere, alpha=0.7, color='red', label='Tracker')
-        
-        # Draw L and M points
-        l_array = np.array(l_positions)
-        m_array = np.array(m_positions)
-        
-        ax.scatter(l_array[:, 0], l_array[:, 1], l_array[:, 2], 
-                  c='blue', marker='o', s=50, label='L Points')
-        ax.scatter(m_array[:, 0], m_array[:, 1], m_array[:, 2], 
-                  c='red', marker='^', s=50, label='M Points')
-        
-        # Draw connecting lines
-        for i in range(len(l_positions)):
-            ax.plot([l_positions[i][0], m_positions[i][0]], 
-                   [l_positions[i][1], m_positions[i][1]], 
-                   [l_positions[i][2], m_positions[i][2]], 
-                   'g-', alpha=0.7, linewidth=2)
-        
-        # Set labels and title
-        ax.set_xlabel('X (mm)')
-        ax.set_ylabel('Y (mm)')
-        ax.set_zlabel('Z (mm)')
-        ax.set_title('Tracker Visualization')
-        
-        # Set view range
-        range_val = 100
-        ax.set_xlim(femur_pos_mm[0] - range_val, femur_pos_mm[0] + range_val)
-        ax.set_ylim(femur_pos_mm[1] - range_val, femur_pos_mm[1] + range_val)
-        ax.set_zlim(femur_pos_mm[2] - range_val, femur_pos_mm[2] + range_val)
-        
-        # Add legend
-        ax.legend()
-        
-        # Show the plot
-        plt.tight_layout()
-        plt.show()
+        self.sphere_artist = ax.plot_surface(self._sphere_base_x + femur_pos_mm[0],
+                                             self._sphere_base_y + femur_pos_mm[1],
+                                             self._sphere_base_z + femur_pos_mm[2],
+                                             alpha=0.7, color='red')
+        
+        # Move the L and M points and the connecting (L, M) segments in place
+        self.l_scatter.set_offsets(l_positions[:, :2])
+        self.l_scatter.set_3d_properties(l_positions[:, 2], 'z')
+        self.m_scatter.set_offsets(m_positions[:, :2])
+        self.m_scatter.set_3d_properties(m_positions[:, 2], 'z')
+        self.link_lines.set_segments(np.stack([l_positions, m_positions], axis=1))
+        
+        # Keep a 100mm range around the tracker, only touching the limits when it moved
+        view_center = tuple(np.round(femur_pos_mm, 1))
+        if view_center != self._view_center:
+            self._view_center = view_center
+            range_val = 100
+            ax.set_xlim3d(femur_pos_mm[0] - range_val, femur_pos_mm[0] + range_val)
+            ax.set_ylim3d(femur_pos_mm[1] - range_val, femur_pos_mm[1] + range_val)
+            ax.set_zlim3d(femur_pos_mm[2] - range_val, femur_pos_mm[2] + range_val)
+        
+        # Show the window without blocking, so it and the artists above stay alive for the
+        # next call; process_events keeps it responsive in between
+        fig.canvas.draw_idle()
+        plt.show(block=False)
+        plt.pause(0.001)
         
         return fig, ax
+    
+    def process_events(self):
+        """Let an open visualization window handle its pending GUI events"""
+        if self.fig is None:
+            return
+        
+        import matplotlib.pyplot as plt
+        
+        if plt.fignum_exists(self.fig.number):
+            self.fig.canvas.flush_events()
+    
+    def _create_figure(self):
+        """Create the figure and the persistent artists that show_visualization updates"""
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Patch
+        from mpl_toolkits.mplot3d import Axes3D
+        from mpl_toolkits.mplot3d.art3d import Line3DCollection
+        
+        self.fig = plt.figure(figsize=(12, 10))
+        self.ax = self.fig.add_subplot(111, projection='3d')
+        self.sphere_artist = None
+        
+        # One scatter per point set and a single collection for the connecting lines
+        self.l_scatter = self.ax.scatter([], [], [], c='blue', marker='o', s=50, label='L Points')
+        self.m_scatter = self.ax.scatter([], [], [], c='red', marker='^', s=50, label='M Points')
+        self.link_lines = Line3DCollection(np.empty((0, 2, 3)), colors='g', alpha=0.7, linewidths=2)
+        self.ax.add_collection(self.link_lines, autolim=False)
+        self._view_center = None
+        
+        # Text, legend and layout never change, so set them up once here. The sphere is
+        # replaced on every call, so the legend uses a stand-in patch for it
+        self.ax.set_xlabel('X (mm)')
+        self.ax.set_ylabel('Y (mm)')
+        self.ax.set_zlabel('Z (mm)')
+        self.ax.set_title('Tracker Visualization')
+        tracker_handle = Patch(color='red', alpha=0.7, label='Tracker')
+        self.ax.legend(handles=[tracker_handle, self.l_scatter, self.m_scatter])
+        self.fig.tight_layout()
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the Rigid Body Tracker main loop
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from rigid_body_tracker import RigidBodyTracker
+
+
+class ConnectAndRunTest(unittest.TestCase):
+    def test_runs_headless_with_stdin_from_dev_null(self):
+        """connect_and_run keeps tracking when stdin can't be polled (service, nohup, '< file')"""
+        tracker = RigidBodyTracker()
+        tracker.udp_port = 0  # Any free port
+        tracker.client.run = lambda mode: True
+        tracker.client.connected = lambda: True
+        
+        # Let the loop run for a moment, then stop it like the 'q' command does
+        stopper = threading.Timer(0.5, setattr, (tracker, 'running', False))
+        
+        with open(os.devnull) as devnull, mock.patch.object(sys, 'stdin', devnull):
+            stopper.start()
+            try:
+                result = tracker.connect_and_run()
+            finally:
+                stopper.cancel()
+        
+        self.assertTrue(result)
+        self.assertIsNotNone(tracker.udp_thread)
+
+
+class ConnectionTestTest(unittest.TestCase):
+    def test_connection_test_reports_from_the_loop_without_blocking(self):
+        """'t' returns at once and the loop's status update reports the result later"""
+        tracker = RigidBodyTracker()
+        tracker.client.connected = lambda: True
+        tracker._pkt_count = 1  # Data is arriving
+        
+        with mock.patch('rigid_body_tracker.time.monotonic', return_value=100.0):
+            tracker.test_connection()
+            tracker.update_connection_status()
+        self.assertTrue(tracker.showing_connection_animation)
+        self.assertIsNotNone(tracker._connection_test_due)
+        
+        with mock.patch('rigid_body_tracker.time.monotonic', return_value=102.0):
+            tracker.update_connection_status()
+        self.assertFalse(tracker.showing_connection_animation)
+        self.assertIsNone(tracker._connection_test_due)
+        self.assertTrue(tracker.connected)
+
+
+if __name__ == "__main__":
+    unittest.main()
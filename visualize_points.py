@@ -5,43 +5,94 @@ Visualizes femoral tracker positions and connecting lines from CSV data
 """
 
 import csv
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+import os
+from functools import lru_cache
+from types import MappingProxyType
 import numpy as np
-from position_calculations import PositionCalculator
+from position_calculations import PositionCalculator, REFERENCE_ROTATION_COLUMNS
+
+# Shared calculator for calculate_point_position; it holds no per-call state
+_CALC = PositionCalculator()
+
+def load_reference_points(filename):
+    """
+    Load the reference points CSV as arrays, reusing the parsed data while the file is unchanged.
+    Shared by the tracker and both visualizers.
+    
+    Returns:
+        dict with the point 'labels' (tuple, CSV order), a read-only 'index' ({label: row})
+        and read-only (N, 3) 'femur' and 'stylus' position arrays in mm and the (N, 4)
+        'rotation' array [x, y, z, w]
+    """
+    return dict(_parse_csv_data(filename, os.path.getmtime(filename)))
 
 def load_csv_data(filename):
-    """Load point data from CSV file"""
-    points = {}
+    """
+    Load point data from CSV file, reusing the parsed data while the file is unchanged
+    
+    Returns:
+        dict: {label: {'femur': [x, y, z], 'stylus': [x, y, z], 'rot': [x, y, z, w]}}
+        built on each call; the values are read-only views of the cached arrays
+    """
+    table = load_reference_points(filename)
+    return {label: {'femur': table['femur'][i], 'stylus': table['stylus'][i], 'rot': table['rotation'][i]}
+            for i, label in enumerate(table['labels'])}
+
+@lru_cache(maxsize=8)
+def _parse_csv_data(filename, mtime):
+    """
+    Parse the point CSV; mtime is only part of the cache key
+    
+    Returns:
+        dict laid out as described in load_reference_points
+    """
+    labels, femur, stylus, rotation = [], [], [], []
     
     with open(filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
+        reader = csv.reader(csvfile)
+        
+        # Resolve the column positions once from the header instead of building a dict per row
+        header = next(reader)
+        column = {name: i for i, name in enumerate(header)}
+        label_col = column['Point_Number']
+        femur_cols = [column[name] for name in ('Femur_Pos_X_mm', 'Femur_Pos_Y_mm', 'Femur_Pos_Z_mm')]
+        stylus_cols = [column[name] for name in ('Stylus_Pos_X_mm', 'Stylus_Pos_Y_mm', 'Stylus_Pos_Z_mm')]
+        rot_cols = [column[name] for name in REFERENCE_ROTATION_COLUMNS]
+        
         for row in reader:
-            point_number = row['Point_Number']
-            
-            # Extract femur position
-            femur_pos = [
-                float(row['Femur_Pos_X_mm']),
-                float(row['Femur_Pos_Y_mm']),
-                float(row['Femur_Pos_Z_mm'])
-            ]
-            
-            # Extract stylus position
-            stylus_pos = [
-                float(row['Stylus_Pos_X_mm']),
-                float(row['Stylus_Pos_Y_mm']),
-                float(row['Stylus_Pos_Z_mm'])
-            ]
+            if not row:
+                continue
             
-            points[point_number] = {
-                'femur': femur_pos,
-                'stylus': stylus_pos
-            }
+            labels.append(row[label_col])
+            femur.append([float(row[i]) for i in femur_cols])
+            stylus.append([float(row[i]) for i in stylus_cols])
+            rotation.append([float(row[i]) for i in rot_cols])
+    
+    table = {
+        'labels': tuple(labels),
+        'index': MappingProxyType({label: i for i, label in enumerate(labels)}),
+        'femur': np.array(femur, dtype=float).reshape(-1, 3),
+        'stylus': np.array(stylus, dtype=float).reshape(-1, 3),
+        'rotation': np.array(rotation, dtype=float).reshape(-1, 4)
+    }
     
-    return points
+    # The rotation math treats zero quaternions as the identity; say so once per file version
+    zero_rows = ~table['rotation'].any(axis=1)
+    if zero_rows.any():
+        print(f"Warning: zero rotation for points {', '.join(np.array(labels)[zero_rows])}; using identity")
+        table['rotation'][zero_rows] = (0.0, 0.0, 0.0, 1.0)
+    
+    # Every caller gets the same cached arrays, so keep them from being modified
+    for name in ('femur', 'stylus', 'rotation'):
+        table[name].setflags(write=False)
+    
+    return table
 
 def visualize_points(filename='Attune_5_Left_Points.csv'):
     """Visualize femoral tracker positions and connecting lines"""
+    # matplotlib is only needed for plotting, so importers of the helpers above don't load it
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
     
     # Load data
     points = load_csv_data(filename)
@@ -136,7 +187,7 @@ def calculate_point_position(point_label, current_femur_pos_meters, current_femu
     Args:
         point_label (str): Point label to calculate (e.g., 'L3', 'M7')
         current_femur_pos_meters (list): Current femoral tracker position [X, Y, Z] in meters
-        current_femur_rot_quat (list): Current femoral tracker rotation quaternion [W, X, Y, Z]
+        current_femur_rot_quat (list): Current femoral tracker rotation quaternion [X, Y, Z, W]
         csv_filename (str): Path to CSV file with reference data
     
     Returns:
@@ -155,30 +206,9 @@ def calculate_point_position(point_label, current_femur_pos_meters, current_femu
     # Get reference data for the requested point
     ref_femur_pos_mm = points[point_label]['femur']
     ref_stylus_pos_mm = points[point_label]['stylus']
+    femur_rotation = points[point_label]['rot']
     
-    # Get femur rotation from CSV (we need to extract this from the CSV properly)
-    # For now, we'll need to read it directly from the CSV
-    femur_rotation = None
-    with open(csv_filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['Point_Number'] == point_label:
-                femur_rotation = [
-                    float(row['Femur_Rot_W']),
-                    float(row['Femur_Rot_X']),
-                    float(row['Femur_Rot_Y']),
-                    float(row['Femur_Rot_Z'])
-                ]
-                break
-    
-    if femur_rotation is None:
-        print(f"Error: Could not find femur rotation for point '{point_label}'")
-        return None
-    
-    # Convert reference positions from mm to meters for calculations
-    calculator = PositionCalculator()
-    ref_femur_pos_meters = calculator.convert_to_meters(ref_femur_pos_mm)
-    ref_stylus_pos_meters = calculator.convert_to_meters(ref_stylus_pos_mm)
+    calculator = _CALC
     
     # Convert current femur position to millimeters for display
     current_femur_pos_mm = calculator.convert_to_millimeters(current_femur_pos_meters)
@@ -207,7 +237,7 @@ def interactive_point_calculator(current_femur_pos_meters, current_femur_rot_qua
     
     Args:
         current_femur_pos_meters (list): Current femoral tracker position [X, Y, Z] in meters
-        current_femur_rot_quat (list): Current femoral tracker rotation quaternion [W, X, Y, Z]
+        current_femur_rot_quat (list): Current femoral tracker rotation quaternion [X, Y, Z, W]
     """
     print("\n=== Point Position Calculator ===")
     print("Enter point labels (e.g., L1, M5) or 'q' to quit")